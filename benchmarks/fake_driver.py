@@ -0,0 +1,92 @@
+import io
+import threading
+from PIL import Image, ImageDraw
+
+class FakeElement:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def send_keys(self, text: str):
+        self.driver.record("send_keys", text)
+
+
+class FakeDriver:
+    """
+    A local stand-in for the Appium driver surface DeviceController and ActionHandler use.
+
+    It renders a plain screen that changes after every gesture, records each
+    command it receives and never talks to a device, so runners can be exercised
+    without an emulator.
+    """
+
+    page_source = "<hierarchy rotation=\"0\"></hierarchy>"
+
+    def __init__(self, name: str = "fake", width: int = 1080, height: int = 2400):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.commands = []
+        self.screen_version = 0
+        self._lock = threading.Lock()
+
+    def record(self, command: str, *args):
+        with self._lock:
+            self.commands.append((command,) + args)
+
+    def get_screenshot_as_png(self) -> bytes:
+        img = Image.new("RGB", (self.width, self.height), "white")
+        draw = ImageDraw.Draw(img)
+        band = (self.screen_version * 211) % (self.height - 200)
+        draw.rectangle((0, band, self.width, band + 200), fill=(30, 90, 200))
+        draw.text((40, 120), f"{self.name} screen {self.screen_version}", fill="black")
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def save_screenshot(self, file_path: str):
+        with open(file_path, "wb") as f:
+            f.write(self.get_screenshot_as_png())
+        return True
+
+    def get_window_size(self) -> dict:
+        return {"width": self.width, "height": self.height}
+
+    def tap(self, positions, duration=None):
+        self.record("tap", positions, duration)
+        self.screen_version += 1
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0):
+        self.record("swipe", start_x, start_y, end_x, end_y, duration)
+        self.screen_version += 1
+
+    def find_element(self, by=None, value=None):
+        self.record("find_element", by, value)
+        return FakeElement(self)
+
+    def execute_script(self, script: str, args: dict = None):
+        """
+        Handles the UiAutomator2 `mobile:` commands DeviceController sends.
+        """
+        args = args or {}
+        if script == "mobile: clickGesture":
+            return self.tap([(args["x"], args["y"])])
+        if script == "mobile: type":
+            return self.record("type", args["text"])
+        if script == "mobile: shell" and args.get("command") == "input" and args["args"][:1] == ["keyevent"]:
+            for keycode in args["args"][1:]:
+                self.press_keycode(int(keycode))
+            return ""
+        raise ValueError(f"Unsupported command: {script}")
+
+    def press_keycode(self, keycode):
+        self.record("press_keycode", keycode)
+        self.screen_version += 1
+
+    def hide_keyboard(self):
+        self.record("hide_keyboard")
+
+    def terminate_app(self, package_name: str):
+        self.record("terminate_app", package_name)
+
+    def quit(self):
+        self.record("quit")
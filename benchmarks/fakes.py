@@ -0,0 +1,216 @@
+import io
+import json
+import random
+import threading
+import time
+from PIL import Image, ImageDraw
+from benchmarks.fake_driver import FakeDriver
+from utils.screenshot import as_screenshot
+
+WIDTH, HEIGHT = 1080, 2400
+
+# The open-amazon-search flow from example/, as screens with tappable elements.
+# Each element is (label, bounds, next_screen).
+AMAZON_FLOW = {
+    "launcher": [("Amazon icon", (330, 170, 490, 310), "home")],
+    "home": [("search bar", (40, 100, 1040, 190), "search")],
+    "search": [("macbook", (40, 200, 1040, 280), "product")],
+    "product": [("Add to cart", (560, 2100, 950, 2220), "added")],
+    "added": [("Cart icon", (440, 2200, 640, 2310), "cart")],
+    "cart": [],
+}
+
+
+class Latency:
+    """
+    A fixed delay plus uniform jitter, in seconds.
+    """
+
+    def __init__(self, base: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.base = base
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, fraction: float = 1.0):
+        with self._lock:
+            delay = (self.base + self._random.uniform(-self.jitter, self.jitter)) * fraction
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ScriptedDriver(FakeDriver):
+    """
+    Fake Appium driver backed by a screen-state machine.
+
+    Tapping inside an element's bounds moves to its next screen. After every
+    transition the next few screenshots are rendered mid-animation, so the
+    settle detector has real work to do. Screenshot and gesture calls sleep
+    for a configurable latency to stand in for the Appium HTTP round-trip.
+    """
+
+    def __init__(self, screens: dict = None, start: str = "launcher", animation_frames: int = 2,
+                 screenshot_latency: Latency = None, gesture_latency: Latency = None):
+        super().__init__(name="scripted", width=WIDTH, height=HEIGHT)
+        self.screens = screens or AMAZON_FLOW
+        self.start = start
+        self.animation_frames = animation_frames
+        self.screenshot_latency = screenshot_latency or Latency()
+        self.gesture_latency = gesture_latency or Latency()
+        self.screenshots_taken = 0
+        self._png_cache = {}
+        self.reset()
+
+    def reset(self):
+        self.screen = self.start
+        self._animating = 0
+
+    def element_center(self, label: str):
+        for name, (left, top, right, bottom), _ in self.screens[self.screen]:
+            if name.lower() == label.lower():
+                return ((left + right) // 2, (top + bottom) // 2)
+        return None
+
+    def get_screenshot_as_png(self) -> bytes:
+        self.screenshot_latency.sleep()
+        self.screenshots_taken += 1
+        frame = self._animating
+        if self._animating:
+            self._animating -= 1
+        return self._render(self.screen, frame)
+
+    @property
+    def page_source(self) -> str:
+        nodes = "".join(
+            f'<node class="android.widget.Button" text="{name}" resource-id="" content-desc="" '
+            f'bounds="[{left},{top}][{right},{bottom}]" displayed="true"/>'
+            for name, (left, top, right, bottom), _ in self.screens[self.screen]
+        )
+        return f"<hierarchy>{nodes}</hierarchy>"
+
+    def tap(self, positions, duration=None):
+        self.gesture_latency.sleep()
+        self.record("tap", positions, duration)
+        x, y = positions[0]
+        for _, (left, top, right, bottom), next_screen in self.screens[self.screen]:
+            if left <= x <= right and top <= y <= bottom:
+                self.screen = next_screen
+                self._animating = self.animation_frames
+                return
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0):
+        self.gesture_latency.sleep()
+        self.record("swipe", start_x, start_y, end_x, end_y, duration)
+
+    def press_keycode(self, keycode):
+        self.gesture_latency.sleep()
+        self.record("press_keycode", keycode)
+
+    def _render(self, screen: str, frame: int) -> bytes:
+        key = (screen, frame)
+        if key not in self._png_cache:
+            img = Image.new("RGB", (WIDTH, HEIGHT), "white")
+            draw = ImageDraw.Draw(img)
+            draw.rectangle((0, 0, WIDTH, 80), fill=(20, 20, 20))
+            # A screen-specific content block, so different screens get clearly different fingerprints.
+            index = list(self.screens).index(screen)
+            draw.rectangle((80 + index * 150, 400 + index * 250, 300 + index * 150, 900 + index * 250), fill=(60, 110, 200))
+            offset = frame * 120  # mid-transition frames are shifted
+            draw.text((40, 120 + offset), screen, fill="black")
+            for name, (left, top, right, bottom), _ in self.screens[screen]:
+                draw.rectangle((left, top + offset, right, bottom + offset), fill=(240, 160, 40))
+                draw.text((left + 10, top + 10 + offset), name, fill="black")
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG")
+            self._png_cache[key] = buffer.getvalue()
+        return self._png_cache[key]
+
+
+class FakeModelClient:
+    """
+    Stands in for OpenAIClient: answers with the scripted action for the driver's
+    current screen after a configurable latency, and counts the bytes it would upload.
+    """
+
+    # Share of the completion latency spent before "action" and "desc" have streamed in.
+    FIRST_STEP_FRACTION = 0.7
+
+    def __init__(self, driver: ScriptedDriver, latency: Latency = None):
+        self.driver = driver
+        self.latency = latency or Latency()
+        self.bytes_uploaded = 0
+        self.calls = 0
+
+    def get_next_step(self, screenshot, system_prompt, user_prompt, previous_steps, user_feedback,
+                      on_partial=None) -> str:
+        self.calls += 1
+        image_url = as_screenshot(screenshot).data_url()
+        self.bytes_uploaded += len(image_url) + len(system_prompt) + len(user_prompt) \
+            + len(previous_steps) + len(user_feedback)
+        elements = self.driver.screens[self.driver.screen]
+        if not elements:
+            step = {"action": "terminate", "desc": "goal reached"}
+        else:
+            step = {"action": "click", "desc": elements[0][0]}
+        if on_partial is None:
+            self.latency.sleep()
+        else:
+            self.latency.sleep(self.FIRST_STEP_FRACTION)
+            on_partial(dict(step))
+            self.latency.sleep(1 - self.FIRST_STEP_FRACTION)
+        return json.dumps(step)
+
+    def get_plan(self, screenshot, system_prompt, user_prompt, previous_steps, user_feedback) -> str:
+        """
+        Plans the whole scripted path from the current screen, ending with terminate.
+        """
+        self.calls += 1
+        image_url = as_screenshot(screenshot).data_url()
+        self.bytes_uploaded += len(image_url) + len(system_prompt) + len(user_prompt) \
+            + len(previous_steps) + len(user_feedback)
+        self.latency.sleep()
+        actions = []
+        screen = self.driver.screen
+        while self.driver.screens[screen] and len(actions) < 5:
+            label, _, screen = self.driver.screens[screen][0]
+            following = self.driver.screens[screen]
+            actions.append({"action": "click", "desc": label, "expect": following[0][0] if following else ""})
+        if not self.driver.screens[screen]:
+            actions.append({"action": "terminate", "desc": "goal reached"})
+        return json.dumps({"actions": actions})
+
+
+class FakeGroundingClient:
+    """
+    Stands in for ShowUiClient: resolves "click on <label>" against the driver's
+    current screen after a configurable latency, counting the image bytes uploaded.
+    A batch uploads the image once and its queries run concurrently, so it takes
+    about as long as a single query.
+    """
+
+    def __init__(self, driver: ScriptedDriver, latency: Latency = None):
+        self.driver = driver
+        self.latency = latency or Latency()
+        self.bytes_uploaded = 0
+        self.calls = 0
+        self.last_backend = None
+
+    def get_coordinate(self, screenshot, query: str, iterations: int = 1) -> tuple:
+        coords, self.last_backend = self.ground(screenshot, [query], iterations)[query]
+        return coords
+
+    def get_coordinates(self, screenshot, queries: list, iterations: int = 1) -> dict:
+        return {query: coords for query, (coords, _) in self.ground(screenshot, queries, iterations).items()}
+
+    def ground(self, screenshot, queries: list, iterations: int = 1) -> dict:
+        self.calls += len(queries)
+        self.bytes_uploaded += len(as_screenshot(screenshot).png_bytes)
+        self.latency.sleep()
+        return {query: (self._resolve(query), "showui") for query in queries}
+
+    def _resolve(self, query: str) -> tuple:
+        label = query
+        for prefix in ("click on ", "Find "):
+            if label.startswith(prefix):
+                label = label[len(prefix):]
+        return self.driver.element_center(label) or (None, None)
@@ -0,0 +1,242 @@
+"""
+Offline end-to-end benchmark for the agent loop.
+
+Drives TestController/ActionHandler against in-process fakes (scripted device,
+model and grounding stubs with configurable latency) and reports per-step
+latency percentiles, a per-phase breakdown, bytes uploaded and throughput.
+
+    python -m benchmarks.run_benchmark --runs 5
+    python -m benchmarks.run_benchmark --save-baseline
+    python -m benchmarks.run_benchmark --compare --max-regression 0.15
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from benchmarks.fakes import ScriptedDriver, FakeModelClient, FakeGroundingClient, Latency
+from clients.grounding_prefetcher import GroundingPrefetcher
+from controllers.approval_policy import AutoApprove
+from controllers.device_controller import DeviceController
+from controllers.test_controller import TestController
+from utils.session_recorder import SessionRecorder
+from utils.step_manager import StepManager
+from utils.tracing import tracer
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PHASES = ["capture", "settle", "llm", "grounding", "action", "logging"]
+# Metrics where a higher value is better; everything else is a latency/cost.
+HIGHER_IS_BETTER = {"steps_per_second"}
+# Millisecond metrics moving by less than this are timer noise, not regressions.
+MIN_DELTA_MS = 10.0
+
+
+class PhaseTimer:
+    """
+    Accumulates wall time per phase by wrapping methods on live objects.
+    Nested wrapped calls are subtracted from the outer phase, so e.g. the
+    settle wait inside a tap is counted as "settle", not "action". Only calls
+    on the agent's own thread are timed: background work (prefetched
+    grounding, log writes) counts only for as long as the agent waits on it.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.step_starts = []
+        self._stack = []
+        self._thread = threading.current_thread()
+
+    def wrap(self, owner, method_name: str, phase: str, marks_step: bool = False):
+        original = getattr(owner, method_name)
+        timer = self
+
+        def timed(*args, **kwargs):
+            if threading.current_thread() is not timer._thread:
+                return original(*args, **kwargs)
+            start = time.perf_counter()
+            if marks_step:
+                timer.step_starts.append(start)
+            timer._stack.append(0.0)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = timer._stack.pop()
+                timer.totals[phase] += elapsed - nested
+                if timer._stack:
+                    timer._stack[-1] += elapsed
+
+        setattr(owner, method_name, timed)
+        return original
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = fraction * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_benchmark(runs: int = 3, llm_latency: float = 0.4, grounding_latency: float = 0.25,
+                  screenshot_latency: float = 0.08, gesture_latency: float = 0.05,
+                  jitter: float = 0.2, plan_mode: bool = False, stream: bool = False) -> dict:
+    """
+    Runs the scripted Amazon flow `runs` times and returns the report dict.
+    :param jitter: Jitter as a fraction of each latency.
+    :param plan_mode: Run TestController in plan mode (several actions per model call).
+    :param stream: Stream single-step completions so grounding starts before the model finishes.
+    """
+    driver = ScriptedDriver(
+        screenshot_latency=Latency(screenshot_latency, screenshot_latency * jitter, seed=1),
+        gesture_latency=Latency(gesture_latency, gesture_latency * jitter, seed=2)
+    )
+    device = DeviceController(None, None, driver=driver)
+    model = FakeModelClient(driver, Latency(llm_latency, llm_latency * jitter, seed=3))
+    grounding = FakeGroundingClient(driver, Latency(grounding_latency, grounding_latency * jitter, seed=4))
+
+    timer = PhaseTimer()
+    timer.wrap(device, "capture", "capture", marks_step=True)
+    timer.wrap(device, "_wait_for_screen_to_settle", "settle")
+    timer.wrap(model, "get_next_step", "llm")
+    timer.wrap(model, "get_plan", "llm")
+    for method_name in ("tap", "scroll", "type_text"):
+        timer.wrap(device, method_name, "action")
+    originals = {
+        (SessionRecorder, name): timer.wrap(SessionRecorder, name, "logging")
+        for name in ("record", "log_text", "close")
+    }
+    # ActionHandler grounds through the per-session prefetcher, so time it at class level.
+    originals[(GroundingPrefetcher, "get_coordinate")] = timer.wrap(GroundingPrefetcher, "get_coordinate", "grounding")
+
+    output_dir = tempfile.mkdtemp(prefix="agent-bench-")
+    executed = 0
+    start = time.perf_counter()
+    try:
+        for run in range(runs):
+            driver.reset()
+            controller = TestController(
+                openai_client=model,
+                showui=grounding,
+                device=device,
+                step_manager=StepManager(),
+                approver=AutoApprove(),
+                output_dir=output_dir,
+                plan_mode=plan_mode,
+                stream=stream
+            )
+            executed += controller.run_test(f"open amazon and add macbook to cart {run}", max_steps=20)["executed"]
+    finally:
+        for (owner, name), original in originals.items():
+            setattr(owner, name, original)
+    end = time.perf_counter()
+
+    boundaries = timer.step_starts + [end]
+    step_latencies = [(b - a) * 1000 for a, b in zip(boundaries, boundaries[1:])]
+    steps = len(step_latencies)
+    return {
+        "runs": runs,
+        "steps": steps,
+        "steps_executed": executed,
+        "model_calls_per_step": round(model.calls / max(steps, 1), 2),
+        "steps_per_second": round(steps / (end - start), 3),
+        "p50_step_ms": round(percentile(step_latencies, 0.5), 1),
+        "p95_step_ms": round(percentile(step_latencies, 0.95), 1),
+        "breakdown_ms_per_step": {
+            phase: round(timer.totals[phase] * 1000 / max(steps, 1), 1) for phase in PHASES
+        },
+        "bytes_uploaded_per_step": round((model.bytes_uploaded + grounding.bytes_uploaded) / max(steps, 1)),
+        "screenshots_per_step": round(driver.screenshots_taken / max(steps, 1), 2),
+    }
+
+
+def flatten(report: dict) -> dict:
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}.{sub_key}"] = sub_value
+        elif isinstance(value, (int, float)) and key not in ("runs", "steps", "steps_executed"):
+            flat[key] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Prints a metric-by-metric comparison and returns the metrics that regressed
+    by more than max_regression (a fraction).
+    """
+    regressions = []
+    current, previous = flatten(report), flatten(baseline)
+    print(f"{'metric':<38}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, value in current.items():
+        if metric not in previous:
+            continue
+        old = previous[metric]
+        change = (value - old) / old if old else 0.0
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        noise = metric.endswith("_ms") or metric.startswith("breakdown_ms")
+        regressed = worse > max_regression and not (noise and abs(value - old) < MIN_DELTA_MS)
+        flag = "  <-- regression" if regressed else ""
+        print(f"{metric:<38}{old:>12}{value:>12}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(metric)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the agent loop against fakes.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of times the scripted flow is run.")
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--grounding-latency", type=float, default=0.25)
+    parser.add_argument("--screenshot-latency", type=float, default=0.08)
+    parser.add_argument("--gesture-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Jitter as a fraction of each latency.")
+    parser.add_argument("--plan", action="store_true", help="Run the agent in plan mode.")
+    parser.add_argument("--stream", action="store_true", help="Stream model completions.")
+    parser.add_argument("--trace", metavar="TRACE_FILE", help="Also write the spans as Chrome trace JSON.")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write the report to {BASELINE_PATH}.")
+    parser.add_argument("--compare", action="store_true", help="Compare against the stored baseline.")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="Fail --compare when a metric is worse than the baseline by more than this fraction.")
+    args = parser.parse_args()
+
+    tracer.enabled = bool(args.trace)
+    report = run_benchmark(
+        runs=args.runs,
+        llm_latency=args.llm_latency,
+        grounding_latency=args.grounding_latency,
+        screenshot_latency=args.screenshot_latency,
+        gesture_latency=args.gesture_latency,
+        jitter=args.jitter,
+        plan_mode=args.plan,
+        stream=args.stream
+    )
+    print(json.dumps(report, indent=2))
+    if args.trace:
+        tracer.export_chrome(args.trace)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[Benchmark] Baseline written to {BASELINE_PATH}")
+
+    if args.compare:
+        if not os.path.exists(BASELINE_PATH):
+            print(f"[Benchmark] No baseline at {BASELINE_PATH}; run with --save-baseline first.")
+            sys.exit(1)
+        with open(BASELINE_PATH, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            print(f"[Benchmark] Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Local stand-in for the ShowUI Space.
+
+Serves the same /on_submit API as showlab/ShowUI, answering queries for the
+elements of the scripted Amazon flow in benchmarks/fakes.py, so ShowUiClient
+(uploads, batching, job concurrency) can be exercised without the network.
+Needs the gradio package, which the agent itself does not depend on.
+
+    python -m benchmarks.showui_standin --port 7860 --delay 0.5
+    SHOWUI_SRC=http://127.0.0.1:7860/ python main.py
+"""
+import argparse
+import time
+from benchmarks.fakes import AMAZON_FLOW, WIDTH, HEIGHT
+
+
+def locate(query: str) -> str:
+    """
+    The center of the element named in the query, as ShowUI's "[x, y]" fractions.
+    """
+    label = query.lower()
+    for prefix in ("click on ", "find "):
+        if label.startswith(prefix):
+            label = label[len(prefix):]
+    for elements in AMAZON_FLOW.values():
+        for name, (left, top, right, bottom), _ in elements:
+            if name.lower() == label:
+                return str([round((left + right) / 2 / WIDTH, 3), round((top + bottom) / 2 / HEIGHT, 3)])
+    return "[0.5, 0.5]"
+
+
+def build_app(delay: float = 0.0):
+    import gradio as gr
+
+    def on_submit(image, query, iterations, is_example_image):
+        time.sleep(delay * max(1, int(iterations or 1)))
+        return image, locate(query)
+
+    with gr.Blocks() as app:
+        image = gr.Image(type="filepath")
+        query = gr.Textbox()
+        iterations = gr.Number(value=1, precision=0)
+        is_example_image = gr.Textbox(value="False")
+        result_image = gr.Image(type="filepath")
+        coordinates = gr.Textbox()
+        gr.Button().click(
+            on_submit,
+            inputs=[image, query, iterations, is_example_image],
+            outputs=[result_image, coordinates],
+            api_name="on_submit",
+            concurrency_limit=None
+        )
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the ShowUI Space.")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds of simulated inference per iteration.")
+    args = parser.parse_args()
+    build_app(args.delay).queue().launch(server_port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import threading
+from utils.decision_cache import DecisionCache
+from utils.screenshot import as_screenshot
+from utils.tracing import tracer
+from utils.util import validate_openai_json, validate_plan_json
+
+class CachedModelClient:
+    """
+    Wraps a model client so repeated (goal, screen, history) questions are
+    answered from a DecisionCache instead of calling the model again.
+
+    Only answers that pass validation are stored, and cached answers are
+    validated again before being returned. Wrap it around a RateLimitedClient
+    so cache hits do not use up the rate limit.
+    """
+
+    def __init__(self, client, cache: DecisionCache, model_name: str = None):
+        """
+        :param client: The model client to wrap (OpenAIClient or compatible).
+        :param cache: Where decisions are stored.
+        :param model_name: Part of the cache key; taken from client.model_name if not given.
+        """
+        self.client = client
+        self.cache = cache
+        self.model_name = model_name or getattr(client, "model_name", "")
+        # One instance is shared by the parallel runner's workers, so the last call's
+        # entry and source are kept per thread.
+        self._local = threading.local()
+
+    @property
+    def last_source(self) -> str:
+        """
+        "cache" or "model", depending on what answered this thread's last call.
+        """
+        return getattr(self._local, "source", None)
+
+    def get_next_step(self, screenshot, system_prompt: str, user_prompt: str,
+                      previous_steps: str, user_feedback: str, on_partial=None) -> str:
+        return self._ask("get_next_step", validate_openai_json, screenshot, system_prompt,
+                         user_prompt, previous_steps, user_feedback, on_partial=on_partial)
+
+    def get_plan(self, screenshot, system_prompt: str, user_prompt: str,
+                 previous_steps: str, user_feedback: str, on_partial=None) -> str:
+        return self._ask("get_plan", validate_plan_json, screenshot, system_prompt,
+                         user_prompt, previous_steps, user_feedback)
+
+    def forget_last(self):
+        """
+        Drops the entry that answered this thread's last question, e.g. because its answer was rejected.
+        """
+        key = getattr(self._local, "key", None)
+        if key is not None:
+            self.cache.discard(*key)
+            self._local.key = None
+
+    def _ask(self, method_name: str, validate, screenshot, system_prompt: str, user_prompt: str,
+             previous_steps: str, user_feedback: str, on_partial=None) -> str:
+        screenshot = as_screenshot(screenshot)
+        # Steps and plans answer different questions, so they never share an entry.
+        context = self.cache.make_context(
+            f"{self.model_name}:{method_name}", system_prompt, user_prompt, previous_steps, user_feedback
+        )
+        fingerprint = screenshot.fingerprint()
+
+        with tracer.span("llm.cache_lookup", method=method_name) as span:
+            cached = self.cache.get(context, fingerprint)
+            span.set(hit=cached is not None)
+        if cached is not None and validate(cached[1], verbose=False):
+            # A near-match is stored under its own fingerprint, which is what forget_last must delete.
+            self._local.key = (context, cached[0])
+            self._local.source = "cache"
+            return cached[1]
+
+        self._local.key = (context, fingerprint)
+        self._local.source = "model"
+        # Only streaming callers pass on_partial, so clients without streaming keep working.
+        extra = {"on_partial": on_partial} if on_partial is not None else {}
+        response = getattr(self.client, method_name)(
+            screenshot=screenshot,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            previous_steps=previous_steps,
+            user_feedback=user_feedback,
+            **extra
+        )
+        if validate(response, verbose=False):
+            self.cache.put(context, fingerprint, system_prompt, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils.tracing import tracer
+
+class GroundingPrefetcher:
+    """
+    Starts grounding queries in the background while the user is still deciding
+    whether to approve a step.
+
+    It exposes the same get_coordinate interface as ShowUiClient, so ActionHandler
+    can use it as a drop-in: a query that was prefetched for the same screenshot
+    returns the background result, anything else falls through to the client.
+    Several queries for one screenshot go to the client as a single batch when
+    it supports ground, so the image is uploaded once.
+    """
+
+    def __init__(self, showui, max_workers: int = 2):
+        """
+        :param showui: The grounding client to call (ShowUiClient or compatible).
+        :param max_workers: Number of grounding calls allowed to run in parallel.
+        """
+        self.showui = showui
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grounding-prefetch")
+        self.pending = {}
+        self.hits = 0
+        self.last_backend = None
+
+    def prefetch(self, screenshot, queries: list):
+        """
+        Submits the queries for the given screenshot to the background pool.
+        """
+        queries = [query for query in dict.fromkeys(queries) if query not in self.pending]
+        if not queries:
+            return
+        if len(queries) > 1 and hasattr(self.showui, "ground"):
+            batches = [queries]
+        else:
+            batches = [[query] for query in queries]
+        for batch in batches:
+            future = self.executor.submit(self._ground_batch, screenshot, batch, tracer.current_session)
+            for query in batch:
+                self.pending[query] = (screenshot, future)
+
+    def get_coordinate(self, screenshot, query: str, iterations: int = 1) -> tuple:
+        entry = self.pending.pop(query, None)
+        if entry is not None:
+            prefetched_screenshot, future = entry
+            if prefetched_screenshot is screenshot and not future.cancelled():
+                try:
+                    coords, self.last_backend = future.result()[query]
+                    self.hits += 1
+                    return coords
+                except Exception as e:
+                    print(f"[GroundingPrefetcher] Prefetch failed, grounding again: {e}")
+        coords, self.last_backend = self._ground(screenshot, query, iterations=iterations)
+        return coords
+
+    def _ground(self, screenshot, query: str, session: str = None, iterations: int = 1) -> tuple:
+        # Worker threads carry the session of the step that asked for the prefetch.
+        with tracer.session(session), tracer.span("grounding.prefetch", query=query):
+            coords = self.showui.get_coordinate(screenshot, query, iterations=iterations)
+        return coords, getattr(self.showui, "last_backend", None)
+
+    def _ground_batch(self, screenshot, queries: list, session: str = None) -> dict:
+        if len(queries) == 1:
+            return {queries[0]: self._ground(screenshot, queries[0], session)}
+        with tracer.session(session), tracer.span("grounding.prefetch", queries=len(queries)):
+            results = self.showui.ground(screenshot, queries)
+        return {query: results.get(query, ((None, None), None)) for query in queries}
+
+    def discard(self):
+        """
+        Drops all outstanding prefetches, e.g. after a step was rejected.
+        Calls that already started run to completion and their results are ignored.
+        """
+        for _, future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+    def shutdown(self):
+        self.discard()
+        self.executor.shutdown(wait=False)
+
+    @property
+    def locate(self):
+        """
+        The wrapped grounder's view hierarchy lookup; missing (AttributeError) if it has none.
+        """
+        return self.showui.locate
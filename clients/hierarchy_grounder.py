@@ -0,0 +1,251 @@
+import re
+import threading
+import xml.etree.ElementTree as ET
+from difflib import SequenceMatcher
+from utils.screenshot import as_screenshot
+from utils.tracing import tracer
+
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+# Prefixes ActionHandler puts in front of the element description.
+QUERY_PREFIXES = ("click on", "find", "tap on", "tap")
+# Class name words that say nothing about what the element is.
+GENERIC_CLASS_WORDS = {"view", "layout", "group", "widget", "android"}
+# Words the model adds to describe the kind of widget ("Amazon icon", "Add to cart button").
+WIDGET_WORDS = {"icon", "button", "btn", "bar", "field", "box", "tab", "link", "option", "menu", "image"}
+# Scores of the match kinds. Only label == query, label == core words and a label containing
+# the core words in order are confident; a merely similar label ("Size 10" for "Size 11")
+# scores at most SIMILAR_CEILING, below any sensible min_confidence, and goes to ShowUI.
+EXACT_SCORE = 1.0
+CORE_SCORE = 0.9
+CONTAINS_SCORE = 0.85
+SIMILAR_CEILING = 0.6
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+class UiElement:
+    def __init__(self, text: str, content_desc: str, resource_id: str, class_name: str, bounds: tuple):
+        self.text = text
+        self.content_desc = content_desc
+        self.resource_id = resource_id
+        self.class_name = class_name
+        self.bounds = bounds
+        # resource-id "com.amazon.mShop:id/search_bar" is matched as "search bar".
+        short_id = resource_id.split("/")[-1] if resource_id else ""
+        self.labels = [label for label in (normalize(text), normalize(content_desc), normalize(short_id)) if label]
+        class_words = set(normalize(class_name.split(".")[-1]).split()) if class_name else set()
+        self.class_words = class_words - GENERIC_CLASS_WORDS
+
+    @property
+    def center(self) -> tuple:
+        left, top, right, bottom = self.bounds
+        return ((left + right) // 2, (top + bottom) // 2)
+
+
+class HierarchyGrounder:
+    """
+    Resolves grounding queries against the UiAutomator2 view hierarchy before
+    falling back to ShowUI.
+
+    The hierarchy (driver.page_source) is fetched once per screen and indexed
+    by text, content-desc, resource-id and class. Queries are fuzzy-matched
+    against that index; only low-confidence matches go to the remote model.
+    It exposes the same get_coordinate interface as ShowUiClient, and
+    `last_backend` reports which backend answered the calling thread's last query.
+    The index is shared between threads and rebuilt by one of them at a time.
+    """
+
+    def __init__(self, driver, fallback, min_confidence: float = 0.8, ambiguity_margin: float = 0.05):
+        """
+        :param driver: The Appium driver to read page_source from.
+        :param fallback: Grounding client for queries the hierarchy cannot answer (ShowUiClient).
+        :param min_confidence: Match score (0..1) required to answer locally.
+        :param ambiguity_margin: If another element at a different spot scores within this margin
+                                 of the best match, the query is left to ShowUI.
+        """
+        self.driver = driver
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self.ambiguity_margin = ambiguity_margin
+        self.stats = {"hierarchy": 0, "showui": 0}
+        self._local = threading.local()
+        self._index_lock = threading.Lock()
+        self._index_key = None
+        self._elements = []
+
+    @property
+    def last_backend(self):
+        return getattr(self._local, "backend", None)
+
+    def get_coordinate(self, screenshot, query: str, iterations: int = 1) -> tuple:
+        screenshot = as_screenshot(screenshot)
+        with tracer.span("hierarchy.find", query=query) as span:
+            element, score = self.find(screenshot, query)
+            span.set(score=round(score, 3), matched=element is not None and score >= self.min_confidence)
+        if element is not None and score >= self.min_confidence:
+            self._local.backend = "hierarchy"
+            self.stats["hierarchy"] += 1
+            # Bounds are in device pixels, which is what taps expect.
+            return element.center
+
+        self.stats["showui"] += 1
+        coords = self.fallback.get_coordinate(screenshot, query, iterations=iterations)
+        self._local.backend = getattr(self.fallback, "last_backend", "showui")
+        return coords
+
+    def get_coordinates(self, screenshot, queries: list, iterations: int = 1) -> dict:
+        """
+        :return: {query: (x, y)}
+        """
+        results = self.ground(screenshot, queries, iterations=iterations)
+        return {query: coords for query, (coords, _) in results.items()}
+
+    def ground(self, screenshot, queries: list, iterations: int = 1) -> dict:
+        """
+        Answers what it can from the hierarchy and sends the rest to the fallback as one batch.
+        :return: {query: ((x, y), backend)}
+        """
+        screenshot = as_screenshot(screenshot)
+        results = {}
+        remaining = []
+        for query in dict.fromkeys(queries):
+            with tracer.span("hierarchy.find", query=query) as span:
+                element, score = self.find(screenshot, query)
+                span.set(score=round(score, 3), matched=element is not None and score >= self.min_confidence)
+            if element is not None and score >= self.min_confidence:
+                self.stats["hierarchy"] += 1
+                results[query] = (element.center, "hierarchy")
+            else:
+                remaining.append(query)
+
+        if remaining:
+            self.stats["showui"] += len(remaining)
+            if hasattr(self.fallback, "ground"):
+                results.update(self.fallback.ground(screenshot, remaining, iterations=iterations))
+            else:
+                for query in remaining:
+                    coords = self.fallback.get_coordinate(screenshot, query, iterations=iterations)
+                    results[query] = (coords, getattr(self.fallback, "last_backend", "showui"))
+        return results
+
+    def locate(self, screenshot, query: str):
+        """
+        Answers only from the view hierarchy, never from the fallback. Only an element whose
+        label is the query, or its core words without widget words, counts; a near miss
+        ("Size 10" for "Size 11") is not on screen.
+        :return: The center of the first such element, otherwise None.
+        """
+        target = self._strip_prefix(normalize(query))
+        for element in self._index(as_screenshot(screenshot)):
+            if self.score(element, target) >= CORE_SCORE:
+                return element.center
+        return None
+
+    def find(self, screenshot, query: str) -> tuple:
+        """
+        :return: (best matching UiElement or None, score in 0..1). Ambiguous matches return None.
+        """
+        elements = self._index(screenshot)
+        target = self._strip_prefix(normalize(query))
+        scored = sorted(
+            ((self.score(element, target), element) for element in elements),
+            key=lambda pair: pair[0],
+            reverse=True
+        )
+        if not scored or scored[0][0] == 0.0:
+            return None, 0.0
+        best_score, best = scored[0]
+        for score, element in scored[1:]:
+            if best_score - score > self.ambiguity_margin:
+                break
+            if not self._overlaps(best, element):
+                return None, best_score
+        return best, best_score
+
+    @staticmethod
+    def score(element: UiElement, target: str) -> float:
+        """
+        Scores how well an element's labels name the (normalized) target. Only whole words
+        in the query's order count as a confident match, and numbers must be the same.
+        """
+        if not target:
+            return 0.0
+        core = " ".join(word for word in target.split() if word not in WIDGET_WORDS) or target
+        numbers = {word for word in core.split() if word.isdigit()}
+        best = 0.0
+        for label in element.labels:
+            if label == target:
+                return EXACT_SCORE
+            if label == core:
+                best = max(best, CORE_SCORE)
+            elif f" {core} " in f" {label} " and {word for word in label.split() if word.isdigit()} == numbers:
+                best = max(best, CONTAINS_SCORE)
+            else:
+                best = max(best, SIMILAR_CEILING * SequenceMatcher(None, label, target).ratio())
+        # "Add to cart button" style queries often also name the widget type.
+        if best >= CONTAINS_SCORE and element.class_words & set(target.split()):
+            best = min(EXACT_SCORE, best + 0.05)
+        return best
+
+    def _index(self, screenshot) -> list:
+        """
+        :return: The elements of the screen, read from the driver again only when the screen changed.
+        """
+        key = screenshot.fingerprint()
+        with self._index_lock:
+            if key != self._index_key:
+                try:
+                    elements = self.parse(self.driver.page_source)
+                except Exception as e:
+                    print(f"[HierarchyGrounder] Could not read the view hierarchy: {e}")
+                    elements = []
+                self._elements = elements
+                self._index_key = key
+            return self._elements
+
+    @staticmethod
+    def parse(page_source: str) -> list:
+        """
+        Builds the element index from a UiAutomator2 XML dump. Only visible
+        elements with a label and a non-empty area are kept.
+        """
+        elements = []
+        root = ET.fromstring(page_source)
+        for node in root.iter():
+            if node.get("displayed", "true") != "true":
+                continue
+            match = BOUNDS_PATTERN.match(node.get("bounds", ""))
+            if not match:
+                continue
+            bounds = tuple(int(value) for value in match.groups())
+            if bounds[2] <= bounds[0] or bounds[3] <= bounds[1]:
+                continue
+            element = UiElement(
+                text=node.get("text", ""),
+                content_desc=node.get("content-desc", ""),
+                resource_id=node.get("resource-id", ""),
+                class_name=node.get("class", node.tag),
+                bounds=bounds
+            )
+            if element.labels:
+                elements.append(element)
+        return elements
+
+    @staticmethod
+    def _strip_prefix(query: str) -> str:
+        for prefix in QUERY_PREFIXES:
+            if query.startswith(prefix + " "):
+                return query[len(prefix):].strip()
+        return query
+
+    @staticmethod
+    def _overlaps(a: UiElement, b: UiElement) -> bool:
+        """
+        A label and its clickable container usually share bounds; those are not ambiguous.
+        """
+        x, y = a.center
+        left, top, right, bottom = b.bounds
+        return left <= x <= right and top <= y <= bottom
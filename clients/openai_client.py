@@ -1,13 +1,8 @@
+import time
 from openai import OpenAI
-import base64
-
-def encode_image(image_path: str) -> str:
-    """
-    Reads the image from the given path and returns its base64-encoded string.
-    """
-    with open(image_path, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode('utf-8')
+from utils.screenshot import as_screenshot
+from utils.tracing import tracer
+from utils.partial_json import PartialJsonParser
 
 class OpenAIClient:
     """
@@ -25,41 +20,86 @@ class OpenAIClient:
 
     def get_next_step(
         self,
-        screenshot_path: str,
+        screenshot,
         system_prompt: str,
         user_prompt: str,
         previous_steps: str,
         user_feedback: str,
+        on_partial=None,
     ) -> str:
         """
         Calls the chosen OpenAI model to get the next suggested step in JSON form.
 
-        :param screenshot_path: Local path to the screenshot for the vision model (if available).
+        :param screenshot: The current Screenshot (or a path to one) for the vision model.
         :param system_prompt: System-level instructions to constrain the model's output.
         :param user_prompt: The user's high-level test goal.
         :param previous_steps: A string containing all previous steps, for context.
+        :param user_feedback: A string with the accepted/rejected suggestions so far.
+        :param on_partial: If given, the completion is streamed and this is called once with the
+                           fields parsed so far as soon as "action" and "desc" are complete
+                           (and "start_from" for a scroll, which is grounded on it).
+                           The returned text still needs validating.
         :return: Raw text from the model, which we expect to be JSON.
         """
 
-        # Base64 encode the screenshot, in case you're using a vision model
-        base64_image = encode_image(screenshot_path)
-        last_3_steps = "\n".join(previous_steps.split("\n")[-3:])
-        # Build the user message (with text + image data). 
-        # If you do NOT have GPT-4 Vision, pass a text description instead of base64 data.
+        return self._complete(
+            "llm.get_next_step",
+            screenshot,
+            system_prompt,
+            user_prompt,
+            previous_steps,
+            user_feedback,
+            instruction="Analyze this image and provide the next important step as minimal JSON.",
+            max_tokens=300,
+            on_partial=on_partial
+        )
+
+    def get_plan(
+        self,
+        screenshot,
+        system_prompt: str,
+        user_prompt: str,
+        previous_steps: str,
+        user_feedback: str,
+    ) -> str:
+        """
+        Asks for a short ordered batch of actions, each with an expected-screen hint.
+        Same inputs as get_next_step; use it with plan_system_prompt.
+
+        :return: Raw text from the model, which we expect to be {"actions": [...]} JSON.
+        """
+        return self._complete(
+            "llm.get_plan",
+            screenshot,
+            system_prompt,
+            user_prompt,
+            previous_steps,
+            user_feedback,
+            instruction="Analyze this image and provide the next steps as minimal JSON.",
+            max_tokens=600
+        )
+
+    def _complete(self, span_name: str, screenshot, system_prompt: str, user_prompt: str,
+                  previous_steps: str, user_feedback: str, instruction: str, max_tokens: int,
+                  on_partial=None) -> str:
+        # Send a downscaled JPEG instead of the native PNG; the model would downscale it anyway.
+        image_url = as_screenshot(screenshot).data_url()
+        # Stable content first (goal, then history oldest to newest) so provider-side
+        # prompt caching can reuse the prefix; the screenshot goes last.
         user_content = [
             {
                 "type": "text",
                 "text": (
                     f"{user_prompt}\n"
                     f"Previous completed steps on the current device:\n{previous_steps}\n"
-                    "Analyze this image and provide the next important step as minimal JSON."
-                    f"User Feedback on previous steps:\n{user_feedback}"
+                    f"User Feedback on previous steps:\n{user_feedback}\n"
+                    f"{instruction}"
                 )
             },
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_image}"
+                    "url": image_url
                 }
             }
         ]
@@ -69,11 +109,66 @@ class OpenAIClient:
             {"role": "user", "content": user_content}
         ]
 
-        completion = self.client.chat.completions.create(
-            model=self.model_name,    
-            messages=messages,
-            max_tokens=300,
-            temperature=0.1
-        )
+        if on_partial is not None:
+            return self._stream(span_name, messages, max_tokens, on_partial, len(image_url))
+
+        with tracer.span(span_name, model=self.model_name, image_bytes=len(image_url)) as span:
+            completion = self.client.chat.completions.create(
+                model=self.model_name,    
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.1
+            )
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                span.set(
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens
+                )
 
         return completion.choices[0].message.content
+
+    def _stream(self, span_name: str, messages: list, max_tokens: int, on_partial, image_bytes: int) -> str:
+        """
+        Streams the completion, feeding it to a PartialJsonParser, and calls on_partial
+        once the fields the step is grounded on are known.
+        """
+        parser = PartialJsonParser()
+        parts = []
+        emitted = False
+        start = time.perf_counter()
+        with tracer.span(span_name, model=self.model_name, image_bytes=image_bytes, stream=True) as span:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.1,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if chunk.usage is not None:
+                    span.set(
+                        prompt_tokens=chunk.usage.prompt_tokens,
+                        completion_tokens=chunk.usage.completion_tokens
+                    )
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                text = chunk.choices[0].delta.content
+                parts.append(text)
+                if emitted:
+                    continue
+                fields = parser.feed(text)
+                if self._grounding_fields_ready(fields):
+                    emitted = True
+                    span.set(first_step_ms=round((time.perf_counter() - start) * 1000, 1))
+                    on_partial(dict(fields))
+
+        return "".join(parts)
+
+    @staticmethod
+    def _grounding_fields_ready(fields: dict) -> bool:
+        if "action" not in fields or "desc" not in fields:
+            return False
+        # A scroll is grounded on where it starts, which may come after desc.
+        return str(fields["action"]).lower() != "scroll" or "start_from" in fields
@@ -0,0 +1,46 @@
+import threading
+import time
+
+class RateLimitedClient:
+    """
+    Wraps a model client so several workers can share it without exceeding
+    the provider's rate limit.
+
+    get_next_step and get_plan calls are capped both in concurrency and in calls per minute;
+    every other attribute is passed through to the wrapped client.
+    """
+
+    def __init__(self, client, max_calls_per_minute: int = 60, max_concurrent: int = 4):
+        """
+        :param client: The model client to wrap (e.g. OpenAIClient).
+        :param max_calls_per_minute: Upper bound on request starts per minute across all workers.
+        :param max_concurrent: Number of requests allowed in flight at once.
+        """
+        self.client = client
+        self.min_spacing = 60.0 / max_calls_per_minute if max_calls_per_minute else 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def get_next_step(self, *args, **kwargs) -> str:
+        with self._semaphore:
+            self._wait_for_slot()
+            return self.client.get_next_step(*args, **kwargs)
+
+    def get_plan(self, *args, **kwargs) -> str:
+        with self._semaphore:
+            self._wait_for_slot()
+            return self.client.get_plan(*args, **kwargs)
+
+    def _wait_for_slot(self):
+        # Reserve the next start time under the lock, then sleep outside it.
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_spacing
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
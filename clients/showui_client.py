@@ -1,44 +1,275 @@
 import os
 import json
+import threading
 from ast import literal_eval
+from collections import OrderedDict, deque
+import httpx
 from gradio_client import Client, handle_file
-from PIL import Image
+from utils.grounding_cache import GroundingCache
+from utils.screenshot import as_screenshot
+from utils.tracing import tracer
+
+SRC_CACHE_PATH = ".cache/gradio_src.json"
+
+
+def connect(src: str, src_cache: str = SRC_CACHE_PATH) -> Client:
+    """
+    Opens a gradio Client for a Space id or URL. The host a Space id resolves to is
+    remembered in src_cache, so later runs connect to it directly and skip the two
+    Hugging Face API lookups (Space address and runtime state) on startup.
+    """
+    hf_token = os.getenv("HUGGINGFACE_API_KEY")
+    if src.startswith(("http://", "https://")) or not src_cache:
+        return Client(src, hf_token=hf_token)
+
+    known = {}
+    if os.path.exists(src_cache):
+        try:
+            with open(src_cache, 'r') as f:
+                known = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ShowUiClient] Ignoring unreadable {src_cache}: {e}")
+    if known.get(src):
+        try:
+            return Client(known[src], hf_token=hf_token)
+        except Exception as e:
+            print(f"[ShowUiClient] {known[src]} did not answer, resolving {src} again: {e}")
+
+    client = Client(src, hf_token=hf_token)
+    known[src] = client.src
+    try:
+        directory = os.path.dirname(src_cache)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(src_cache, 'w') as f:
+            json.dump(known, f)
+    except OSError as e:
+        print(f"[ShowUiClient] Could not write {src_cache}: {e}")
+    return client
+
 
 class ShowUiClient:
-    def __init__(self):
-        self.client = Client("showlab/ShowUI", hf_token=os.getenv("HUGGINGFACE_API_KEY"))
+    """
+    Grounds element descriptions to pixel coordinates with ShowUI.
+
+    ground answers several queries about one screenshot: the image is uploaded
+    to the Space once and every query refers to the uploaded file, and the
+    queries are submitted as gradio jobs that run side by side, up to
+    max_concurrency at a time. It returns the backend ("cache" or "showui")
+    with each result; get_coordinates and get_coordinate return coordinates only.
+
+    The connection to the Space is opened on first use; call warm_up() to open
+    it in the background before the first query.
+    """
+
+    def __init__(self, cache: GroundingCache = None, src: str = None, client=None, max_concurrency: int = 4,
+                 src_cache: str = SRC_CACHE_PATH):
+        """
+        :param cache: Optional grounding cache consulted before calling ShowUI.
+        :param src: Space id or URL of a gradio app with the same /on_submit API, e.g. a local
+                    stand-in server for tests. Defaults to $SHOWUI_SRC, then "showlab/ShowUI".
+        :param client: An already constructed gradio Client to use instead of connecting to src.
+        :param max_concurrency: Default number of queries of one batch in flight at the same time.
+        :param src_cache: File remembering the address a Space id resolved to (None disables it).
+        """
+        self.src = src or os.getenv("SHOWUI_SRC") or "showlab/ShowUI"
+        self.src_cache = src_cache
+        self._client = client
+        self._connect_lock = threading.Lock()
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self._local = threading.local()
+        self.uploads = 0
+        # Screenshot content hash -> URL of the copy already uploaded to the Space.
+        self._uploaded = OrderedDict()
+        self._upload_lock = threading.Lock()
+        self._url_inputs = True
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._connect_lock:
+                if self._client is None:
+                    with tracer.span("showui.connect"):
+                        self._client = connect(self.src, self.src_cache)
+        return self._client
+
+    @property
+    def last_backend(self):
+        """
+        "cache" or "showui", depending on what answered this thread's last get_coordinate call.
+        """
+        return getattr(self._local, "backend", None)
+
+    def warm_up(self):
+        """
+        Opens the connection to the Space now instead of on the first query.
+        """
+        return self.client
 
-    def get_coordinate(self, screenshot_path: str, query: str, iterations: int = 1) -> tuple:
+    def get_coordinate(self, screenshot, query: str, iterations: int = 1) -> tuple:
         """
         Calls ShowUI, which now returns a string like "[0.49, 0.06]".
         Parse that as fractional x,y in [0..1] and convert to pixels.
+        Results are served from the grounding cache when the same query was
+        already answered for a matching screen.
+        :param iterations: Refinement passes ShowUI runs on the query (more is slower but more precise).
         """
-        result = self.client.predict(
-            image=handle_file(screenshot_path),
+        coords, self._local.backend = self.ground(screenshot, [query], iterations=iterations)[query]
+        return coords
+
+    def get_coordinates(self, screenshot, queries: list, iterations: int = 1, max_concurrency: int = None) -> dict:
+        """
+        :return: {query: (x, y)} in pixels, (None, None) for queries ShowUI could not answer.
+        """
+        results = self.ground(screenshot, queries, iterations=iterations, max_concurrency=max_concurrency)
+        return {query: coords for query, (coords, _) in results.items()}
+
+    def ground(self, screenshot, queries: list, iterations: int = 1, max_concurrency: int = None) -> dict:
+        """
+        Grounds several queries against the same screenshot, uploading it at most once.
+        :param queries: Element descriptions, e.g. a click target and a scroll's start_from.
+        :param iterations: Refinement passes ShowUI runs on each query.
+        :param max_concurrency: Queries in flight at the same time; defaults to the client's max_concurrency.
+        :return: {query: ((x, y), backend)}, with (None, None) for queries ShowUI could not answer.
+        """
+        screenshot = as_screenshot(screenshot)
+        width, height = screenshot.size
+        results = {}
+        cache_keys = {}
+        if self.cache is not None:
+            fingerprint = screenshot.fingerprint()
+            for query in queries:
+                cache_keys[query] = self.cache.make_key(fingerprint, (width, height), query)
+
+        remaining = []
+        for query in dict.fromkeys(queries):
+            if query in cache_keys:
+                with tracer.span("showui.cache_lookup") as span:
+                    cached = self.cache.get(cache_keys[query])
+                    span.set(hit=cached is not None)
+                if cached is not None:
+                    results[query] = (cached, "cache")
+                    continue
+            remaining.append(query)
+
+        if remaining:
+            for query, result in self._predict(screenshot, remaining, iterations, max_concurrency).items():
+                coords = self._parse(result, width, height)
+                results[query] = (coords, "showui")
+                if query in cache_keys and coords[0] is not None:
+                    self.cache.put(cache_keys[query], coords)
+        return results
+
+    def _predict(self, screenshot, queries: list, iterations: int, max_concurrency: int) -> dict:
+        """
+        Submits one /on_submit job per query, keeping at most max_concurrency of them running.
+
+        A job that fails with the uploaded copy's URL is asked again with the file itself.
+        Only if that succeeds was the URL the problem, and later batches send the file with
+        each job; otherwise the query failed for another reason and the mode is kept.
+        :return: {query: raw result, or None if the call failed}.
+        """
+        limit = max(1, max_concurrency or self.max_concurrency)
+        image = self._image_input(screenshot)
+        results = {}
+        url_errors = {}
+        # Includes the upload, the wait in the Space's gradio queue and inference.
+        with tracer.span("showui.predict", queries=len(queries), iterations=iterations):
+            waiting = deque((query, image) for query in queries)
+            running = deque()
+            while waiting or running:
+                while waiting and len(running) < limit:
+                    query, job_image = waiting.popleft()
+                    if "url" in job_image and not self._url_inputs:
+                        job_image = handle_file(screenshot.path)
+                    running.append((query, job_image, self._submit(job_image, query, iterations)))
+                query, job_image, job = running.popleft()
+                try:
+                    results[query] = job.result()
+                except Exception as e:
+                    if "url" in job_image:
+                        url_errors[query] = e
+                        waiting.appendleft((query, handle_file(screenshot.path)))
+                        continue
+                    print(f"[ShowUiClient] Grounding '{query}' failed: {e}")
+                    results[query] = None
+                    continue
+                if query in url_errors and self._url_inputs:
+                    print(f"[ShowUiClient] The Space refused the uploaded image, uploading per query: {url_errors[query]}")
+                    self._url_inputs = False
+        return {query: results[query] for query in queries}
+
+    def _submit(self, image: dict, query: str, iterations: int):
+        return self.client.submit(
+            image=image,
             query=query,
-            iterations=1,
+            iterations=iterations,
             is_example_image="False",
             api_name="/on_submit"
         )
+
+    def _image_input(self, screenshot) -> dict:
+        """
+        The image argument for /on_submit: the URL of a copy uploaded once per screenshot,
+        or the local file (which gradio uploads again with every job) if that is not possible.
+        The copy is uploaded from memory, so the frame does not have to be written to disk first.
+        """
+        if not self._url_inputs:
+            return handle_file(screenshot.path)
+        key = screenshot.content_hash()
+        with self._upload_lock:
+            url = self._uploaded.get(key)
+            if url is None:
+                try:
+                    with tracer.span("showui.upload"):
+                        url = self._upload(screenshot.png_bytes, f"{key}.png")
+                except Exception as e:
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.is_client_error:
+                        # The Space has no upload route or does not accept ours.
+                        print(f"[ShowUiClient] Upload refused, uploading per query from now on: {e}")
+                        self._url_inputs = False
+                    else:
+                        print(f"[ShowUiClient] Upload failed, sending the file with this batch: {e}")
+                    return handle_file(screenshot.path)
+                self.uploads += 1
+                self._uploaded[key] = url
+                while len(self._uploaded) > 16:
+                    self._uploaded.popitem(last=False)
+            else:
+                self._uploaded.move_to_end(key)
+        return handle_file(url)
+
+    def _upload(self, png_bytes: bytes, name: str) -> str:
+        # Same request gradio_client makes for a file input, done once instead of per job.
+        response = httpx.post(
+            self.client.upload_url,
+            headers=self.client.headers,
+            cookies=self.client.cookies,
+            verify=self.client.ssl_verify,
+            files=[("files", (name, png_bytes, "image/png"))],
+            **self.client.httpx_kwargs
+        )
+        response.raise_for_status()
+        return self.client.src_prefixed + "file=" + response.json()[0]
+
+    @staticmethod
+    def _parse(result, width: int, height: int) -> tuple:
         if not result or len(result) < 2:
             return (None, None)
 
-        coord_str = result[1] 
+        coord_str = result[1]
         try:
             coords = literal_eval(coord_str)
             if not isinstance(coords, (list, tuple)) or len(coords) < 2:
                 return (None, None)
 
-            x_fraction = float(coords[0])  
+            x_fraction = float(coords[0])
             y_fraction = float(coords[1])
 
             # Convert fractional coords to pixel coords
-            with Image.open(screenshot_path) as img:
-                width, height = img.size
-
             pixel_x = int(x_fraction * width)
             pixel_y = int(y_fraction * height)
-
             return (pixel_x, pixel_y)
         except Exception as e:
             print(f"[ShowUiClient] Error parsing coordinates: {e}")
@@ -0,0 +1,189 @@
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from utils.util import validate_openai_json
+
+APPROVE = "yes"
+REJECT = "no"
+QUIT = "quit"
+
+
+def parse_step(next_step_str: str) -> dict:
+    try:
+        step = json.loads(next_step_str)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    return step if isinstance(step, dict) else {}
+
+
+def step_signature(next_step_str: str) -> tuple:
+    """
+    Normalized (action, desc, start_from, direction) used to spot repeated suggestions.
+    """
+    step = parse_step(next_step_str)
+    return tuple(str(step.get(key, "")).strip().lower() for key in ("action", "desc", "start_from", "direction"))
+
+
+class ApprovalPolicy(ABC):
+    """
+    Decides whether TestController executes a suggested step.
+
+    decide() returns the decision ("yes", "no" or "quit") with the reason for it;
+    TestController passes the reason on to StepManager with the user feedback.
+    Policies that wrap another policy call its decide(), so a decision is only
+    reported once, by the outermost policy. Calling a policy returns just the
+    decision, like any other approver callable.
+    """
+
+    def start_goal(self, test_goal: str):
+        """
+        Called by TestController before the first step of a goal.
+        """
+
+    def __call__(self, next_step_str: str) -> str:
+        decision, reason = self.decide(next_step_str)
+        if reason:
+            print(f"[{type(self).__name__}] {decision}: {reason}")
+        return decision
+
+    @abstractmethod
+    def decide(self, next_step_str: str) -> tuple:
+        """
+        :return: (decision, reason); the reason is "" when there is nothing to explain.
+        """
+
+
+class ConsoleApproval(ApprovalPolicy):
+    """
+    Asks a human on the console, as the agent always did.
+    """
+
+    def decide(self, next_step_str: str) -> tuple:
+        return input("Approve this step? (yes/no/quit): ").strip().lower(), ""
+
+
+class AutoApprove(ApprovalPolicy):
+    def decide(self, next_step_str: str) -> tuple:
+        return APPROVE, ""
+
+
+class RuleBasedApproval(ApprovalPolicy):
+    """
+    Allows or denies steps by action type and a regex on desc.
+
+    Rules are dicts like {"action": "system", "desc": "power|home"}; a missing
+    key or "*" matches anything. Deny rules win over allow rules; steps matching
+    neither are passed to the fallback policy.
+    """
+
+    def __init__(self, allow: list = None, deny: list = None, fallback: ApprovalPolicy = None):
+        self.allow = allow or []
+        self.deny = deny or []
+        self.fallback = fallback or AutoApprove()
+
+    def start_goal(self, test_goal: str):
+        self.fallback.start_goal(test_goal)
+
+    def decide(self, next_step_str: str) -> tuple:
+        step = parse_step(next_step_str)
+        for rule in self.deny:
+            if self._matches(rule, step):
+                return REJECT, f"denied by rule {rule}"
+        for rule in self.allow:
+            if self._matches(rule, step):
+                return APPROVE, f"allowed by rule {rule}"
+        return self.fallback.decide(next_step_str)
+
+    @staticmethod
+    def _matches(rule: dict, step: dict) -> bool:
+        action = rule.get("action", "*")
+        if action != "*" and action.lower() != str(step.get("action", "")).lower():
+            return False
+        pattern = rule.get("desc", "*")
+        return pattern == "*" or re.search(pattern, str(step.get("desc", "")), re.IGNORECASE) is not None
+
+
+class ConfidenceGate(ApprovalPolicy):
+    """
+    Approves through the inner policy and only escalates when something looks off:
+    the suggestion fails schema validation, or it repeats a step that was already rejected.
+    """
+
+    def __init__(self, inner: ApprovalPolicy = None, escalate_to: ApprovalPolicy = None):
+        """
+        :param inner: Policy used for confident steps (auto-approve by default).
+        :param escalate_to: Policy used for doubtful steps (the console by default;
+                            use a rule-based or reject-all policy when nobody is watching).
+        """
+        self.inner = inner or AutoApprove()
+        self.escalate_to = escalate_to or ConsoleApproval()
+        self.rejected = set()
+
+    def start_goal(self, test_goal: str):
+        self.inner.start_goal(test_goal)
+        self.escalate_to.start_goal(test_goal)
+        self.rejected = set()
+
+    def decide(self, next_step_str: str) -> tuple:
+        signature = step_signature(next_step_str)
+        if not validate_openai_json(next_step_str, verbose=False):
+            decision, reason = self._escalate(next_step_str, "suggestion failed validation")
+        elif signature in self.rejected:
+            decision, reason = self._escalate(next_step_str, "repeats a rejected step")
+        else:
+            decision, reason = self.inner.decide(next_step_str)
+        if decision == REJECT:
+            self.rejected.add(signature)
+        return decision, reason
+
+    def _escalate(self, next_step_str: str, why: str) -> tuple:
+        decision, reason = self.escalate_to.decide(next_step_str)
+        return decision, f"escalated: {why}" + (f"; {reason}" if reason else "")
+
+
+class BudgetPolicy(ApprovalPolicy):
+    """
+    Ends a goal once it has used up its step or time budget; otherwise defers to the inner policy.
+    """
+
+    def __init__(self, inner: ApprovalPolicy = None, max_steps: int = None, max_seconds: float = None):
+        self.inner = inner or AutoApprove()
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.steps = 0
+        self.started_at = time.time()
+
+    def start_goal(self, test_goal: str):
+        self.inner.start_goal(test_goal)
+        self.steps = 0
+        self.started_at = time.time()
+
+    def decide(self, next_step_str: str) -> tuple:
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return QUIT, f"step budget of {self.max_steps} used up"
+        if self.max_seconds is not None and time.time() - self.started_at >= self.max_seconds:
+            return QUIT, f"time budget of {self.max_seconds}s used up"
+        self.steps += 1
+        return self.inner.decide(next_step_str)
+
+
+def build_policy(name: str, max_steps: int = None, max_seconds: float = None) -> ApprovalPolicy:
+    """
+    Builds a policy from a short name: "console", "auto", "rules" or "gate",
+    wrapped in a BudgetPolicy when a budget is given.
+    """
+    if name == "auto":
+        policy = AutoApprove()
+    elif name == "rules":
+        # Never power off the device or leave the app under test unattended.
+        policy = RuleBasedApproval(deny=[{"action": "system", "desc": "^(power|home|recent_apps)$"}])
+    elif name == "gate":
+        policy = ConfidenceGate()
+    elif name == "console":
+        policy = ConsoleApproval()
+    else:
+        raise ValueError(f"Unknown approval policy: {name}")
+    if max_steps is not None or max_seconds is not None:
+        policy = BudgetPolicy(policy, max_steps=max_steps, max_seconds=max_seconds)
+    return policy
@@ -1,66 +1,289 @@
+import json
+import os
+import time
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
 from appium.webdriver.common.appiumby import AppiumBy
-import time
-import hashlib
+from selenium.common.exceptions import NoSuchElementException, UnknownMethodException
+from selenium.webdriver.remote.command import Command
+from utils.settle_detector import SettleDetector
+from utils.screenshot import Screenshot
+from utils.tracing import tracer
+
+SESSION_FILE = ".cache/appium_sessions.json"
+# Error text of servers that do not know a `mobile:` command, or refuse adb shell
+# because Appium was started without --allow-insecure adb_shell.
+UNSUPPORTED_MARKERS = ("unknown command", "unknown mobile command", "unsupported operation",
+                       "not supported", "not implemented", "insecure feature", "has not been enabled")
+
+
+class AttachedRemote(webdriver.Remote):
+    """
+    A driver for an Appium session that is already running, e.g. one left open by the
+    previous run. Construction checks that the session is still alive instead of
+    creating a new one.
+    """
+
+    def __init__(self, command_executor: str, session_id: str, options):
+        self.attach_session_id = session_id
+        super().__init__(command_executor, options=options, direct_connection=False)
+
+    def start_session(self, capabilities, browser_profile=None):
+        self.session_id = self.attach_session_id
+        self.caps = dict(capabilities) if isinstance(capabilities, dict) else {}
+        # Cheapest call that needs a live session; fails if the session has ended.
+        self.execute(Command.GET_TIMEOUTS)
+
 
 class DeviceController:
-    def __init__(self, appium_server: str, desired_caps: dict):
-        self.driver = webdriver.Remote(appium_server, options=UiAutomator2Options().load_capabilities(desired_caps))
+    """
+    Sends gestures, text and keys to the device through Appium.
+
+    Commands go out as single UiAutomator2 `mobile:` requests where the server
+    supports them (a click gesture without the 100ms hold, text typed into
+    whatever has focus, several key events in one shell call) and fall back to
+    the generic WebDriver calls otherwise. Gestures wait for the screen to
+    settle unless the caller passes settle=False.
+    """
+
+    def __init__(self, appium_server: str, desired_caps: dict, settle_detector: SettleDetector = None, driver=None,
+                 session_id: str = None, reuse_session: bool = False, session_file: str = SESSION_FILE):
+        """
+        :param driver: An already created driver (e.g. a fake for local runs); skips opening an Appium session.
+        :param session_id: Attach to this running Appium session instead of creating one.
+        :param reuse_session: Attach to the session a previous run left open for this server and device
+                              (recorded in session_file), and record the session this run uses. Opening a
+                              session installs and starts the UiAutomator2 server, which takes several seconds.
+        :param session_file: Where reusable session ids are kept.
+        """
+        self.session_file = session_file
+        self.reused_session = False
+        if driver is None:
+            driver = self._open_session(appium_server, desired_caps, session_id, reuse_session)
+        self.driver = driver
+        self.settle_detector = settle_detector or SettleDetector()
+        # Last stable frame seen by the settle detector, reused by the next take_screenshot.
+        self.last_frame = None
+        # Element that had focus when text was last typed; valid until the next gesture.
+        self._focused = None
+        # `mobile:` commands the server rejected once and is not asked for again.
+        self._unsupported = set()
 
-    def tap(self, x: float, y: float):
+    def tap(self, x: float, y: float, settle: bool = True):
+        """
+        :param settle: Wait for the screen to stop changing afterwards. Skip it when the
+                       next step does not need a fresh frame.
+        """
+        self._screen_changed()
         try:
-            self.driver.tap([(x, y)], 100)
-            self._wait_for_screen_to_settle()
+            with tracer.span("device.tap"):
+                if not self._mobile("mobile: clickGesture", {"x": int(x), "y": int(y)}):
+                    self.driver.tap([(x, y)], 100)
+            if settle:
+                self._wait_for_screen_to_settle()
         except Exception as e:
             print(f"[DeviceController] Failed to tap at ({x},{y}): {e}")
 
-    def type_text(self, text: str):
+    def type_text(self, text: str, settle: bool = False):
+        """
+        Types into the focused field: one `mobile: type` request if the server supports it,
+        otherwise send_keys on the focused element, which is looked up once and reused
+        until the next gesture.
+        """
+        self.last_frame = None
         try:
-            focused_element = self.driver.find_element(
-                by=AppiumBy.XPATH,
-                value='//*[@focused="true"]'
-            )
-            focused_element.send_keys(text)
+            with tracer.span("device.type", chars=len(text)):
+                if not self._mobile("mobile: type", {"text": text}):
+                    self._type_into_focused(text)
+            if settle:
+                self._wait_for_screen_to_settle()
         except Exception as e:
-            print(f"[DeviceController] Could not type text")
+            print(f"[DeviceController] Could not type text: {e}")
 
-    def scroll(self, start_x: int, start_y: int, end_x: int, end_y: int):
+    def press_keys(self, keycodes: list, settle: bool = True) -> bool:
+        """
+        Presses Android keycodes in order, all in one `input keyevent` shell call when the
+        server allows adb shell, otherwise one press_keycode request per key.
+        :return: True if every key was sent.
+        """
+        self._screen_changed()
+        try:
+            with tracer.span("device.keys", keys=len(keycodes)):
+                command = {"command": "input", "args": ["keyevent"] + [str(code) for code in keycodes]}
+                if not self._mobile("mobile: shell", command):
+                    for code in keycodes:
+                        self.driver.press_keycode(code)
+            if settle:
+                self._wait_for_screen_to_settle()
+            return True
+        except Exception as e:
+            print(f"[DeviceController] Failed to press keys {keycodes}: {e}")
+            return False
+
+    def wait_for_focus(self, timeout: float = 3.0, interval: float = 0.1) -> bool:
+        """
+        Waits until an element has input focus, e.g. after tapping a search bar that opens a
+        search screen. That is all a following type_text needs. If nothing gets focus in time,
+        or the driver cannot tell, it waits for the screen to settle instead.
+        :return: True if a focused element was found, False if it waited for the screen to settle.
+        """
+        deadline = time.monotonic() + timeout
+        with tracer.span("device.wait_for_focus") as span:
+            while True:
+                try:
+                    self._focused = self.driver.switch_to.active_element
+                    span.set(focused=True)
+                    return True
+                except NoSuchElementException:
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(interval)
+                except Exception:
+                    break
+            span.set(focused=False)
+        self._wait_for_screen_to_settle()
+        return False
+
+    def hide_keyboard(self):
+        self._screen_changed()
+        with tracer.span("device.hide_keyboard"):
+            self.driver.hide_keyboard()
+
+    def scroll(self, start_x: int, start_y: int, end_x: int, end_y: int, settle: bool = True):
         """
         Scrolls starting from (start_x, start_y) in the given direction.
         """
+        self._screen_changed()
         try:
-            self.driver.swipe(start_x, start_y, end_x, end_y, duration=800)
-            self._wait_for_screen_to_settle()
+            with tracer.span("device.swipe"):
+                self.driver.swipe(start_x, start_y, end_x, end_y, duration=800)
+            if settle:
+                self._wait_for_screen_to_settle()
             print(f"[DeviceController] Scrolled ({start_x}, {start_y}) to {end_x}, {end_y}")
         except Exception as e:
             print(f"[DeviceController] Scroll failed")
 
 
-    def take_screenshot(self, file_path: str):
-        self.driver.save_screenshot(file_path)
+    def capture(self, file_path: str = None, store=None) -> Screenshot:
+        """
+        Returns the current screen as an in-memory Screenshot. If the previous action
+        just settled, its final stable frame is reused instead of capturing again.
+        :param file_path: If given, the frame is also written there in the background.
+        :param store: ScreenshotStore that saves the frame once something needs it on disk.
+        """
+        if self.last_frame is not None:
+            png_bytes = self.last_frame
+            self.last_frame = None
+        else:
+            png_bytes = self.driver.get_screenshot_as_png()
+        screenshot = Screenshot(png_bytes, store=store)
+        if file_path:
+            screenshot.save_async(file_path)
+        return screenshot
+
+    def take_screenshot(self, file_path: str) -> str:
+        """
+        Captures the screen and waits until it is written to file_path.
+        """
+        return self.capture(file_path).path
 
     def terminate_app(self, package_name: str):
         self.driver.terminate_app(package_name)
-    
-    def _wait_for_screen_to_settle(self, timeout=10, interval=0.5):
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f"[DeviceController] Failed to close the session: {e}")
+
+    def _wait_for_screen_to_settle(self, timeout=10):
         """
-        Waits until the screen stops changing, based on consecutive screenshot hashes.
+        Waits until the screen stops changing, comparing downscaled frames with a tolerance.
         :param timeout: Max time (seconds) to wait before giving up.
-        :param interval: How often to capture screenshots.
         :return: True if stabilized, False if timed out.
         """
-        start_time = time.time()
-        prev_hash = None
+        with tracer.span("device.settle") as span:
+            settled, frame = self.settle_detector.wait(self.driver.get_screenshot_as_png, timeout=timeout)
+            span.set(iterations=self.settle_detector.iterations, settled=settled)
+        self.last_frame = frame if settled else None
+        return settled
+
+    def _open_session(self, appium_server: str, desired_caps: dict, session_id: str, reuse_session: bool):
+        options = UiAutomator2Options().load_capabilities(desired_caps)
+        key = f"{appium_server}|{desired_caps.get('udid') or desired_caps.get('deviceName', '')}"
+        known = self._load_sessions() if reuse_session else {}
+        session_id = session_id or known.get(key)
+        driver = None
+        if session_id:
+            try:
+                with tracer.span("device.attach"):
+                    driver = AttachedRemote(appium_server, session_id, options)
+                self.reused_session = True
+                print(f"[DeviceController] Attached to Appium session {session_id}")
+            except Exception as e:
+                print(f"[DeviceController] Could not attach to session {session_id}, opening a new one: {e}")
+        if driver is None:
+            with tracer.span("device.session"):
+                driver = webdriver.Remote(appium_server, options=options)
+        if reuse_session and known.get(key) != driver.session_id:
+            known[key] = driver.session_id
+            self._save_sessions(known)
+        return driver
 
-        while time.time() - start_time < timeout:
-            image_data = self.driver.get_screenshot_as_png()
-            current_hash = hashlib.md5(image_data).hexdigest()
+    def _load_sessions(self) -> dict:
+        if not os.path.exists(self.session_file):
+            return {}
+        try:
+            with open(self.session_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[DeviceController] Ignoring unreadable {self.session_file}: {e}")
+            return {}
 
-            if prev_hash == current_hash:
-                return True
+    def _save_sessions(self, sessions: dict):
+        try:
+            directory = os.path.dirname(self.session_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.session_file, 'w') as f:
+                json.dump(sessions, f, indent=2)
+        except OSError as e:
+            print(f"[DeviceController] Could not write {self.session_file}: {e}")
 
-            prev_hash = current_hash
-            time.sleep(interval)
+    def _screen_changed(self):
+        self.last_frame = None
+        self._focused = None
 
-        return False
+    def _mobile(self, command: str, args: dict) -> bool:
+        """
+        Runs a UiAutomator2 `mobile:` command.
+        :return: False if the server does not support it, so the caller can fall back.
+        """
+        if command in self._unsupported:
+            return False
+        try:
+            self.driver.execute_script(command, args)
+            return True
+        except Exception as e:
+            if isinstance(e, UnknownMethodException) or any(marker in str(e).lower() for marker in UNSUPPORTED_MARKERS):
+                self._unsupported.add(command)
+                print(f"[DeviceController] '{command}' is not available, using the generic command: {e}")
+            else:
+                # Anything else may be transient; the next call tries the `mobile:` command again.
+                print(f"[DeviceController] '{command}' failed, using the generic command this time: {e}")
+            return False
+
+    def _type_into_focused(self, text: str):
+        if self._focused is not None:
+            try:
+                self._focused.send_keys(text)
+                return
+            except Exception:
+                self._focused = None
+        try:
+            # The W3C active element is one lookup instead of a search over the whole hierarchy.
+            element = self.driver.switch_to.active_element
+        except Exception:
+            element = self.driver.find_element(by=AppiumBy.XPATH, value='//*[@focused="true"]')
+        element.send_keys(text)
+        self._focused = element
@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import time
+from controllers.device_controller import DeviceController
+from controllers.test_controller import TestController
+from controllers.approval_policy import AutoApprove
+from utils.step_manager import StepManager
+
+class ParallelTestRunner:
+    """
+    Runs a list of goals across a pool of devices concurrently.
+
+    Each device gets one worker thread that owns its DeviceController and
+    grounding client and pulls goals from a shared queue; every goal gets a
+    fresh StepManager, TestController and log files. The model client is
+    shared, so it should be wrapped in a RateLimitedClient.
+    """
+
+    def __init__(
+        self,
+        endpoints: list,
+        model_client,
+        showui_factory,
+        approval_factory=None,
+        device_factory=None,
+        output_dir: str = "runs",
+        max_steps_per_goal: int = 30,
+        plan_mode: bool = False,
+        stream: bool = False,
+        screen_graph=None
+    ):
+        """
+        :param endpoints: One dict per device with "appium_server" and "desired_caps" (and optionally "name").
+        :param model_client: Model client shared by all workers.
+        :param showui_factory: Callable taking the worker's DeviceController and returning its grounding client.
+        :param approval_factory: Callable returning a fresh ApprovalPolicy for each goal.
+                                 Runs are unattended, so it should not prompt on the console.
+        :param device_factory: Callable endpoint -> DeviceController; defaults to opening an Appium session.
+        :param output_dir: Root directory for per-device logs and screenshots.
+        :param max_steps_per_goal: Safety limit on model suggestions per goal.
+        :param plan_mode: Run every goal in plan mode (see TestController).
+        :param stream: Stream model completions (see TestController).
+        :param screen_graph: ScreenGraph shared by all workers (see TestController).
+        """
+        self.endpoints = endpoints
+        self.model_client = model_client
+        self.showui_factory = showui_factory
+        self.approval_factory = approval_factory or AutoApprove
+        self.device_factory = device_factory or self._open_device
+        self.output_dir = output_dir
+        self.max_steps_per_goal = max_steps_per_goal
+        self.plan_mode = plan_mode
+        self.stream = stream
+        self.screen_graph = screen_graph
+
+    @staticmethod
+    def _open_device(endpoint: dict) -> DeviceController:
+        return DeviceController(appium_server=endpoint["appium_server"], desired_caps=endpoint["desired_caps"])
+
+    @staticmethod
+    def endpoint_name(endpoint: dict, index: int) -> str:
+        return endpoint.get("name") or endpoint.get("desired_caps", {}).get("deviceName") or f"device-{index}"
+
+    def run(self, goals: list) -> dict:
+        """
+        Runs every goal once on whichever device frees up first.
+        :return: {"results": [per-goal dicts in input order], "summary": aggregate throughput}.
+        """
+        goal_queue = queue.Queue()
+        for index, goal in enumerate(goals):
+            goal_queue.put((index, goal))
+        results = [None] * len(goals)
+
+        start_time = time.time()
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(endpoint, self.endpoint_name(endpoint, i), goal_queue, results),
+                name=f"runner-{i}",
+                daemon=True
+            )
+            for i, endpoint in enumerate(self.endpoints)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start_time
+
+        for index, goal in enumerate(goals):
+            if results[index] is None:
+                results[index] = {"goal": goal, "device": None, "status": "not_run",
+                                  "suggested": 0, "executed": 0, "seconds": 0.0}
+
+        executed = sum(r["executed"] for r in results)
+        summary = {
+            "goals": len(goals),
+            "completed": sum(1 for r in results if r["status"] == "completed"),
+            "failed": sum(1 for r in results if r["status"] in ("error", "not_run")),
+            "devices": len(self.endpoints),
+            "seconds": round(elapsed, 2),
+            "steps_executed": executed,
+            "steps_per_second": round(executed / elapsed, 3) if elapsed else 0.0,
+            "goals_per_minute": round(len(goals) * 60 / elapsed, 2) if elapsed else 0.0,
+        }
+        return {"results": results, "summary": summary}
+
+    def _worker(self, endpoint: dict, name: str, goal_queue: queue.Queue, results: list):
+        try:
+            device = self.device_factory(endpoint)
+            showui = self.showui_factory(device)
+        except Exception as e:
+            print(f"[ParallelTestRunner] Could not start worker for {name}: {e}")
+            return
+
+        try:
+            while True:
+                try:
+                    index, goal = goal_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                controller = TestController(
+                    openai_client=self.model_client,
+                    showui=showui,
+                    device=device,
+                    step_manager=StepManager(),
+                    approver=self.approval_factory(),
+                    output_dir=os.path.join(self.output_dir, name),
+                    plan_mode=self.plan_mode,
+                    stream=self.stream,
+                    screen_graph=self.screen_graph
+                )
+                goal_start = time.time()
+                try:
+                    result = controller.run_test(goal, max_steps=self.max_steps_per_goal)
+                except Exception as e:
+                    print(f"[ParallelTestRunner] Goal '{goal}' failed on {name}: {e}")
+                    result = {"goal": goal, "status": "error", "error": str(e), "suggested": 0, "executed": 0}
+                result["device"] = name
+                result["seconds"] = round(time.time() - goal_start, 2)
+                results[index] = result
+        finally:
+            device.quit()
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from clients.showui_client import ShowUiClient
+from controllers.device_controller import DeviceController
+from handlers.action_handler import ActionHandler
+from utils.session_recorder import SessionRecorder
+from utils.fingerprint import hamming_distance
+from utils.screenshot import Screenshot
+from utils.screenshot_store import ScreenshotStore
+from utils.step_manager import StepManager
+
+class ReplayController:
+    """
+    Replays a recorded <slug>_action.json session straight against the device.
+
+    Each recorded step carries the fingerprint of the screen it was grounded on.
+    When the live screen still matches, the recorded coordinates are used as-is;
+    otherwise the step is re-grounded through ShowUI on the current screenshot.
+    """
+
+    def __init__(
+        self,
+        device: DeviceController,
+        showui: ShowUiClient,
+        match_threshold: int = 12,
+        screenshot_store: ScreenshotStore = None
+    ):
+        """
+        :param device: Device to replay against.
+        :param showui: Grounding client used for steps whose screen drifted.
+        :param match_threshold: Max fingerprint bit distance still treated as the same screen.
+        :param screenshot_store: Where replay frames are kept; defaults to the screenshots/ store
+                                 next to the replayed action file, where its session was recorded.
+        """
+        self.device = device
+        self.showui = showui
+        self.match_threshold = match_threshold
+        self.screenshot_store = screenshot_store
+
+    @staticmethod
+    def load_actions(action_file_path: str) -> list:
+        """
+        Reads the action file together with the files SessionRecorder rotated out of it,
+        oldest (<file>.N) first, so the steps come back in the order they were recorded.
+        """
+        paths = [action_file_path]
+        index = 1
+        while os.path.exists(f"{action_file_path}.{index}"):
+            paths.insert(0, f"{action_file_path}.{index}")
+            index += 1
+        actions = []
+        for path in paths:
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        actions.append(json.loads(line))
+        return actions
+
+    def replay(self, action_file_path: str) -> dict:
+        """
+        Replays every step of the action file in order.
+        :return: A summary with counts of replayed, re-grounded and failed steps.
+        """
+        stem = os.path.splitext(action_file_path)[0]
+        if stem.endswith("_action"):
+            stem = stem[:-len("_action")]
+        store = self.screenshot_store
+        if store is None:
+            store = ScreenshotStore(os.path.join(os.path.dirname(action_file_path), "screenshots"))
+        recorder = SessionRecorder(f"{stem}_replay", screenshot_store=store)
+        action_handler = ActionHandler(self.device, self.showui, recorder, StepManager())
+
+        summary = {"replayed": 0, "regrounded": 0, "failed": 0}
+        start_time = time.time()
+        for index, step in enumerate(self.load_actions(action_file_path)):
+            screenshot = self.device.capture(store=store)
+            recorder.begin_step(replay_of=step.get("step", index + 1))
+
+            # A scroll_search's coordinates are where it found its target; the swipes are run again.
+            searched = step.get("action") == "scroll_search"
+            if self._screen_matches(step, screenshot) and step.get("coordinates") and not searched:
+                recorded = {k: v for k, v in step.items() if k in ("action", "desc", "start_from", "coordinates")}
+                ok = action_handler.replay_action(recorded, screenshot)
+                outcome = "replayed"
+            else:
+                live_step = {k: v for k, v in step.items() if k in ("action", "desc", "start_from", "direction")}
+                ok = action_handler.handle_action(live_step, screenshot)
+                outcome = "regrounded" if step.get("coordinates") and not searched else "replayed"
+
+            if not ok:
+                summary["failed"] += 1
+                print(f"[ReplayController] Step {index + 1} failed: {step.get('action')} {step.get('desc')}")
+                break
+            summary[outcome] += 1
+            print(f"[ReplayController] Step {index + 1} {outcome}: {step.get('action')} {step.get('desc')}")
+
+        recorder.close()
+        summary["seconds"] = round(time.time() - start_time, 2)
+        print(f"[ReplayController] Replay finished: {summary}")
+        return summary
+
+    def _screen_matches(self, step: dict, screenshot: Screenshot) -> bool:
+        recorded = step.get("screen")
+        if not recorded:
+            # Recordings made before fingerprints were logged: trust the coordinates.
+            return True
+        try:
+            current = screenshot.fingerprint()
+        except Exception as e:
+            print(f"[ReplayController] Could not fingerprint screenshot: {e}")
+            return False
+        return hamming_distance(recorded, current) <= self.match_threshold
@@ -1,14 +1,24 @@
 import json
+import os
 import time
 from slugify import slugify
 from clients.openai_client import OpenAIClient
 from clients.showui_client import ShowUiClient
+from clients.grounding_prefetcher import GroundingPrefetcher
 from controllers.device_controller import DeviceController
-from utils.action_logger import ActionLogger
-from utils.step_manager import StepManager
-from utils.util import validate_openai_json
+from utils.screen_graph import ScreenGraph
+from utils.screenshot_store import ScreenshotStore
+from utils.session_recorder import SessionRecorder
+from utils.step_manager import StepManager, StepContextManager
+from utils.tracing import tracer
+from utils.util import validate_openai_json, validate_plan_json
 from handlers.action_handler import ActionHandler
-from .system_prompt import system_prompt
+from .approval_policy import ApprovalPolicy, ConsoleApproval, parse_step
+from .system_prompt import system_prompt, plan_system_prompt
+
+# Times a graph step is asked about again after an answer that is not yes/no/quit.
+MAX_INVALID_ANSWERS = 3
+
 
 class TestController:
     """
@@ -19,6 +29,16 @@ class TestController:
       - asking user for approval
       - executing device actions
       - logging actions
+
+    In plan mode the model is asked for a short batch of actions at once. They
+    are executed back to back, and after each one a cheap check (did the screen
+    change, is the expected element visible in the view hierarchy) decides
+    whether to continue with the batch or ask the model again from the
+    current screen.
+
+    With a ScreenGraph, a goal that was completed before first follows the
+    shortest known path to its final screen without the model, and every
+    finished session is merged back into the graph.
     """
 
     def __init__(
@@ -26,61 +46,324 @@ class TestController:
         openai_client: OpenAIClient,
         showui: ShowUiClient,
         device: DeviceController,
-        step_manager: StepManager
+        step_manager: StepManager,
+        context_manager: StepContextManager = None,
+        approver=None,
+        output_dir: str = "",
+        plan_mode: bool = False,
+        max_plan_actions: int = 5,
+        stream: bool = False,
+        screen_graph: ScreenGraph = None,
+        screenshot_store: ScreenshotStore = None
     ):
+        """
+        :param approver: An ApprovalPolicy (or any callable) taking the suggested step string
+                         and returning "yes", "no" or "quit". Defaults to asking on the console.
+        :param output_dir: Directory for logs and screenshots; the working directory by default.
+        :param plan_mode: Ask the model for several actions per call instead of one.
+        :param max_plan_actions: Upper bound on actions executed from a single plan.
+        :param stream: Stream single-step completions and start grounding once the fields the
+                       step is grounded on have arrived. The client's get_next_step must accept on_partial.
+        :param screen_graph: Known screens and transitions, used to navigate without the model.
+        :param screenshot_store: Where frames are kept; defaults to a store in <output_dir>/screenshots.
+        """
         self.openai_client = openai_client
         self.showui = showui
         self.device = device
         self.step_manager = step_manager
+        self.context_manager = context_manager or StepContextManager()
+        self.approver = approver or ConsoleApproval()
+        self.output_dir = output_dir
+        self.plan_mode = plan_mode
+        self.max_plan_actions = max_plan_actions
+        self.stream = stream
+        self.screen_graph = screen_graph
+        self.screenshot_store = screenshot_store
 
-    def run_test(self, test_goal: str):
+    def run_test(self, test_goal: str, max_steps: int = None) -> dict:
         """
         Runs an interactive test session given a single test goal (e.g. "Test the search bar").
+        :param max_steps: Stop after this many model suggestions (unlimited by default).
+        :return: A summary with the final status, the number of suggested/executed steps
+                 and the number of model calls.
         """
-        # Take initial screenshot
-        logger = ActionLogger(log_file_path=f"{slugify(test_goal)[:20]}.txt")
-        action_data_logger= ActionLogger(log_file_path=f"{slugify(test_goal)[:20]}_action.json")
-        action_handler = ActionHandler(self.device, self.showui, logger, action_data_logger, self.step_manager)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        if hasattr(self.approver, "start_goal"):
+            self.approver.start_goal(test_goal)
+        log_stem = os.path.join(self.output_dir, slugify(test_goal)[:20])
+        if self.screenshot_store is None:
+            self.screenshot_store = ScreenshotStore(os.path.join(self.output_dir, "screenshots"))
+        recorder = SessionRecorder(log_stem, screenshot_store=self.screenshot_store)
+        # Grounding for a suggested step starts while the user is still reading it.
+        prefetcher = GroundingPrefetcher(self.showui)
+        action_handler = ActionHandler(self.device, prefetcher, recorder, self.step_manager)
 
-        while True:
+        result = {"goal": test_goal, "status": "running", "suggested": 0, "executed": 0, "model_calls": 0}
+        if self.screen_graph is not None:
+            with tracer.session(test_goal), tracer.span("graph.navigate"):
+                status = self._follow_graph(test_goal, max_steps, result, action_handler, recorder)
+            if status is not None:
+                result["status"] = status
+        while result["status"] == "running":
+            with tracer.session(test_goal), tracer.span("agent.step", step=result["suggested"] + 1):
+                prefetcher.discard()
+                if max_steps is not None and result["suggested"] >= max_steps:
+                    print(f"[TestController] Reached the limit of {max_steps} steps.")
+                    result["status"] = "step_limit"
+                    break
 
-            timestamp = int(time.time())
+                capture_start = time.perf_counter()
+                screenshot = self._capture()
+                capture_ms = (time.perf_counter() - capture_start) * 1000
 
-            screenshot_path = f"screenshots/screenshot_{timestamp}.png"
+                user_prompt = f"Goal: {test_goal}"
+                previous_steps, user_feedback = self.context_manager.build(self.step_manager)
 
-            self.device.take_screenshot(screenshot_path)
+                llm_start = time.perf_counter()
+                if self.plan_mode:
+                    steps = self._get_plan(screenshot, user_prompt, previous_steps, user_feedback, result)
+                else:
+                    extra = {}
+                    if self.stream:
+                        # Start grounding as soon as the streamed step names its target.
+                        extra["on_partial"] = lambda partial: prefetcher.prefetch(
+                            screenshot, ActionHandler.grounding_queries(partial)
+                        )
+                    steps = [(self.openai_client.get_next_step(
+                        screenshot=screenshot,
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        previous_steps=previous_steps,
+                        user_feedback=user_feedback,
+                        **extra
+                    ), "")]
+                    result["model_calls"] += 1
+                timings = {
+                    "capture": round(capture_ms, 1),
+                    "llm": round((time.perf_counter() - llm_start) * 1000, 1)
+                }
 
-            user_prompt = f"Goal: {test_goal}"
+                status = self._run_steps(steps, screenshot, timings, max_steps, result,
+                                         action_handler, prefetcher, recorder)
+                if status is not None:
+                    result["status"] = status
+                    break
 
-            next_step_str = self.openai_client.get_next_step(
-                screenshot_path=screenshot_path,
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                previous_steps=self.step_manager.get_steps_as_text(),
-                user_feedback=self.step_manager.get_user_feedback()
+        prefetcher.shutdown()
+        recorder.close()
+        self.screenshot_store.enforce_retention()
+        if self.screen_graph is not None:
+            completed = result["status"] == "completed"
+            self.screen_graph.add_session_file(
+                recorder.jsonl_path,
+                goal=test_goal if completed else None,
+                final_screen=result.get("final_screen") if completed else None
             )
-            validate_openai_json(next_step_str)
+        print(f"[TestController] Test session ended after {result['model_calls']} model calls.")
+        if tracer.enabled:
+            print(tracer.summary_table(session=test_goal))
+        return result
+
+    def _get_plan(self, screenshot, user_prompt: str, previous_steps: str, user_feedback: str,
+                  result: dict) -> list:
+        """
+        Asks the model for a plan and returns it as (step string, expect hint) pairs.
+        Falls back to a single get_next_step suggestion if the plan is not valid.
+        Every request is counted in result["model_calls"].
+        """
+        plan_str = self.openai_client.get_plan(
+            screenshot=screenshot,
+            system_prompt=plan_system_prompt,
+            user_prompt=user_prompt,
+            previous_steps=previous_steps,
+            user_feedback=user_feedback
+        )
+        result["model_calls"] += 1
+        if validate_plan_json(plan_str):
+            steps = []
+            for action in json.loads(plan_str)["actions"][:self.max_plan_actions]:
+                expect = action.pop("expect", "") or ""
+                steps.append((json.dumps(action), expect))
+            print(f"\n[OpenAI Plan]: {len(steps)} actions")
+            return steps
+
+        print("[TestController] Plan was not valid JSON, asking for a single step.")
+        result["model_calls"] += 1
+        return [(self.openai_client.get_next_step(
+            screenshot=screenshot,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            previous_steps=previous_steps,
+            user_feedback=user_feedback
+        ), "")]
+
+    def _run_steps(self, steps: list, screenshot, timings: dict, max_steps: int, result: dict,
+                   action_handler: ActionHandler, prefetcher: GroundingPrefetcher,
+                   recorder: SessionRecorder) -> str:
+        """
+        Approves and executes the suggested steps in order. Steps after the first run on
+        a fresh capture and only while the previous step looks like it went as planned.
+        :return: The final session status ("quit", "completed", "step_limit"), or None to ask the model again.
+        """
+        previous_action = None
+        previous_expect = ""
+        previous_settled = True
+        for index, (next_step_str, expect) in enumerate(steps):
+            if index > 0:
+                if max_steps is not None and result["suggested"] >= max_steps:
+                    print(f"[TestController] Reached the limit of {max_steps} steps.")
+                    return "step_limit"
+                prefetcher.discard()
+                before = screenshot
+                capture_start = time.perf_counter()
+                screenshot = self._capture()
+                timings = {"capture": round((time.perf_counter() - capture_start) * 1000, 1)}
+                if not self._on_track(previous_action, previous_expect, before, screenshot, previous_settled):
+                    print("[TestController] Screen does not match the plan, re-planning.")
+                    return None
+
+            result["suggested"] += 1
+            recorder.begin_step(timings=timings)
+            if len(steps) > 1:
+                recorder.annotate(plan_index=index)
+            if validate_openai_json(next_step_str):
+                prefetcher.prefetch(screenshot, ActionHandler.grounding_queries(json.loads(next_step_str)))
             print(f"\n[OpenAI Suggestion]: {next_step_str}")
 
-            user_input = input("Approve this step? (yes/no/quit): ").strip().lower()
+            user_input, reason = self._approve(next_step_str)
             if user_input == "quit":
-                print("[TestController] User ended the test session.")
-                break
+                print("[TestController] Test session ended by the approver.")
+                return "quit"
             elif user_input == "no":
-                self.step_manager.add_user_feedback(next_step_str, False)
+                self.step_manager.add_user_feedback(next_step_str, False, reason)
+                # A rejected answer must not be served from the decision cache again.
+                if hasattr(self.openai_client, "forget_last"):
+                    self.openai_client.forget_last()
                 print("[TestController] Skipping this step.")
-                continue
+                return None
             elif user_input == "yes":
-                self.step_manager.add_user_feedback(next_step_str, True)
+                self.step_manager.add_user_feedback(next_step_str, True, reason)
                 try:
                     action_data = json.loads(next_step_str)
                 except json.JSONDecodeError:
                     print("[TestController] Could not parse JSON. Skipping.")
-                    continue
+                    return None
                 if action_data.get("action", "").lower() == "terminate":
-                    break
-                action_handler.handle_action(action_data, screenshot_path)
+                    result["final_screen"] = screenshot.fingerprint()
+                    return "completed"
+                # Typing only needs the field to have focus, so the step before it waits for
+                # a focused element instead of the whole transition and keyboard animation.
+                next_action = parse_step(steps[index + 1][0]).get("action", "") if index + 1 < len(steps) else ""
+                settle = str(next_action).lower() != "type"
+                if not action_handler.handle_action(action_data, screenshot, settle=settle):
+                    return None
+                previous_settled = settle or not self.device.wait_for_focus()
+                result["executed"] += 1
+                previous_action = action_data.get("action", "").lower()
+                previous_expect = expect
             else:
                 print("[TestController] Invalid input. Please answer yes/no/quit.")
+                return None
+        return None
+
+    def _follow_graph(self, test_goal: str, max_steps: int, result: dict,
+                      action_handler: ActionHandler, recorder: SessionRecorder) -> str:
+        """
+        Walks the shortest known path from the current screen to the screen the goal was
+        last completed on. Each step still goes through the approver. Stops at the first
+        screen that does not match the graph and leaves the rest to the model.
+        :return: "quit" or "step_limit" if the session should end, otherwise None.
+        """
+        target = self.screen_graph.goal_target(test_goal)
+        if target is None:
+            return None
+        screenshot = self._capture()
+        path = self.screen_graph.shortest_path(screenshot.fingerprint(), target)
+        if not path:
+            return None
+        print(f"[TestController] Following {len(path)} known steps from the screen graph.")
+
+        for edge in path:
+            if max_steps is not None and result["suggested"] >= max_steps:
+                print(f"[TestController] Reached the limit of {max_steps} steps.")
+                return "step_limit"
+            if not self.screen_graph.matches(screenshot.fingerprint(), edge["source"]):
+                break
+            action_data = ScreenGraph.action_data(edge)
+            next_step_str = json.dumps({k: v for k, v in action_data.items() if k != "coordinates"})
+            result["suggested"] += 1
+            recorder.begin_step()
+            print(f"\n[Screen graph]: {next_step_str}")
+
+            user_input, reason = self._approve(next_step_str)
+            for _ in range(MAX_INVALID_ANSWERS):
+                if user_input in ("yes", "no", "quit"):
+                    break
+                print("[TestController] Invalid input. Please answer yes/no/quit.")
+                user_input, reason = self._approve(next_step_str)
+            if user_input == "quit":
+                print("[TestController] Test session ended by the approver.")
+                return "quit"
+            if user_input not in ("yes", "no"):
+                # Not an answer about the step: leave it to the model without recording a rejection.
+                print("[TestController] No valid answer, handing over to the model.")
+                break
+            if user_input == "no":
+                self.step_manager.add_user_feedback(next_step_str, False, reason)
+                break
+            self.step_manager.add_user_feedback(next_step_str, True, reason)
+
+            if "coordinates" in action_data:
+                executed = action_handler.replay_action(action_data, screenshot, backend="graph")
+            else:
+                executed = action_handler.handle_action(action_data, screenshot)
+            if not executed:
+                self.screen_graph.record_failure(edge)
+                break
+            result["executed"] += 1
+            screenshot = self._capture()
+            if not self.screen_graph.matches(screenshot.fingerprint(), edge["target"]):
+                print("[TestController] Screen left the known path, handing over to the model.")
+                self.screen_graph.record_failure(edge)
+                break
+        return None
+
+    def _approve(self, next_step_str: str) -> tuple:
+        """
+        Asks the approver about a step. ApprovalPolicies also explain their decision;
+        plain callables only return it.
+        :return: (decision, reason)
+        """
+        with tracer.span("approval"):
+            if isinstance(self.approver, ApprovalPolicy):
+                decision, reason = self.approver.decide(next_step_str)
+            else:
+                decision, reason = self.approver(next_step_str), ""
+        if reason:
+            print(f"[{type(self.approver).__name__}] {decision}: {reason}")
+        return decision, reason
+
+    def _on_track(self, action: str, expect: str, before, after, settled: bool = True) -> bool:
+        """
+        Cheap check between plan steps: the screen must have changed (except after typing,
+        a scroll_search that found its target without swiping, or a step that did not wait
+        for the screen to settle), and the expected element, if any, must be found in the
+        view hierarchy.
+        """
+        with tracer.span("plan.check") as span:
+            if settled and action not in ("type", "scroll_search") and before.fingerprint() == after.fingerprint():
+                span.set(reason="unchanged")
+                return False
+            # Only grounders that can search the view hierarchy (HierarchyGrounder) can check the hint.
+            if expect and hasattr(self.showui, "find"):
+                element, score = self.showui.find(after, expect)
+                if element is None or score < getattr(self.showui, "min_confidence", 0.8):
+                    span.set(reason="expect_missing", expect=expect)
+                    return False
+            return True
 
-        print("[TestController] Test session ended.")
+    def _capture(self):
+        # Frames only reach disk when a step is recorded (or ShowUI cannot take an in-memory upload).
+        with tracer.span("device.capture"):
+            return self.device.capture(store=self.screenshot_store)
@@ -1,96 +1,226 @@
 import json
+import time
+from utils.fingerprint import hamming_distance
+from utils.screenshot import as_screenshot
+from utils.tracing import tracer
+
 class ActionHandler:
-    def __init__(self, device, showui, logger, action_data_logger, step_manager):
+    # Frames closer than this (in fingerprint bits) count as unchanged: the list did not move.
+    END_OF_LIST_DISTANCE = 2
+
+    def __init__(self, device, showui, recorder, step_manager, max_search_swipes: int = 15):
+        """
+        :param recorder: SessionRecorder receiving the text view and one structured record per action.
+        :param max_search_swipes: Upper bound on swipes a scroll_search makes before giving up.
+        """
         self.device = device
         self.showui = showui
-        self.logger = logger
-        self.action_data_logger = action_data_logger
+        self.recorder = recorder
         self.step_manager = step_manager
+        self.max_search_swipes = max_search_swipes
 
         self.action_registry = {
             "click": self.handle_click,
             "type": self.handle_type,
             "scroll": self.handle_scroll,
+            "scroll_search": self.handle_scroll_search,
             "system": self.handle_system
         }
 
-    def handle_action(self, action_data, screenshot_path):
+    def handle_action(self, action_data, screenshot, settle: bool = True):
+        """
+        :param settle: Wait for the screen to settle after a click, scroll or key press. Pass False
+                       when the next step does not need a fresh frame. Typing never waits, and
+                       scroll_search always does because it compares the frames between swipes.
+        """
         action = action_data.get("action", "").lower()
         handler = self.action_registry.get(action)
 
         if handler:
-            result = handler(action_data, screenshot_path)
+            result = handler(action_data, screenshot, settle=settle)
             return result
         else:
             print(f"[ActionHandler] Unknown action: {action}")
             return False
 
-    def handle_click(self, action_data, screenshot_path):
+    @staticmethod
+    def grounding_queries(action_data) -> list:
+        """
+        Returns the ShowUI queries the action will need, so they can be prefetched.
+        """
+        action = action_data.get("action", "").lower()
+        if action == "click":
+            return [f"click on {action_data.get('desc', '')}"]
+        if action == "scroll" and action_data.get("start_from"):
+            return [f"Find {action_data['start_from']}"]
+        return []
+
+    def replay_action(self, action_data, screenshot, backend: str = "recorded"):
+        """
+        Executes a recorded click or scroll at its recorded coordinates, without grounding.
+        :param backend: Stored as the record's grounding_backend ("recorded" for replays, "graph" for the screen graph).
+        """
+        action = action_data.get("action", "").lower()
+        coords = action_data.get("coordinates")
+        if action == "click" and coords and len(coords) == 2:
+            self._timed("action", self.device.tap, *coords)
+            self.recorder.log_text(f"CLICK {action_data.get('desc', '')}")
+        elif action == "scroll" and coords and len(coords) == 4:
+            self._timed("action", self.device.scroll, *coords)
+            self.recorder.log_text(f"SCROLL {action_data.get('desc', '')} from {action_data.get('start_from', '')}")
+        else:
+            print(f"[ActionHandler] Cannot replay '{action}' without recorded coordinates.")
+            return False
+        self.step_manager.add_step(json.dumps({k: v for k, v in action_data.items() if k in ("action", "desc", "start_from")}))
+        action_data["grounding_backend"] = backend
+        self._record(action_data, screenshot)
+        return True
+
+    def handle_click(self, action_data, screenshot, settle: bool = True):
         desc = action_data.get("desc", "")
-        (x, y) = self.showui.get_coordinate(screenshot_path, f"click on {desc}")
+        (x, y) = self._timed("grounding", self.showui.get_coordinate, screenshot, self.grounding_queries(action_data)[0])
         if x is not None and y is not None:
-            self.device.tap(x, y)
-            self.logger.log_action(f"CLICK {desc}")
+            self._timed("action", self.device.tap, x, y, settle)
+            self.recorder.log_text(f"CLICK {desc}")
             self.step_manager.add_step(json.dumps(action_data))
             action_data["coordinates"] = [x, y]
-            self.action_data_logger.log_action(json.dumps(action_data))
+            action_data["grounding_backend"] = getattr(self.showui, "last_backend", None)
+            self._record(action_data, screenshot)
             return True
         print("[ActionHandler] ShowUI failed to find coordinates.")
         return False
 
-    def handle_type(self, action_data, screenshot_path):
+    def handle_type(self, action_data, screenshot, settle: bool = True):
         text_to_type = action_data.get("desc", "")
         try:
-            self.device.type_text(text_to_type)
-            self.logger.log_action(f"TYPE {text_to_type}")
+            self._timed("action", self.device.type_text, text_to_type)
+            self.recorder.log_text(f"TYPE {text_to_type}")
             self.step_manager.add_step(json.dumps(action_data))
+            self._record(action_data, screenshot)
             return True
         except Exception as e:
             print(f"[ActionHandler] Failed to type: {e}")
             return False
 
-    def handle_scroll(self, action_data, screenshot_path):
+    def handle_scroll(self, action_data, screenshot, settle: bool = True):
         direction = action_data.get("desc", "").lower()
         start_from = action_data.get("start_from", "")
         if start_from:
-            (start_x, start_y) = self.showui.get_coordinate(screenshot_path, f"Find {start_from}")
+            (start_x, start_y) = self._timed("grounding", self.showui.get_coordinate, screenshot, self.grounding_queries(action_data)[0])
             if start_x is not None and start_y is not None:
 
                 window_size = self.device.driver.get_window_size()
-                width, height = window_size['width'], window_size['height']
-
-                end_x, end_y = start_x, start_y
-
-                BUFFER_RATIO = 0.3  # 30% buffer from top/bottom
-                buffer_pixels = int(height * BUFFER_RATIO)
-
-                if direction == "up":
-                    if start_y > (height - buffer_pixels):  # Too close to bottom
-                        start_y = height - buffer_pixels
-                    end_y = min(height, start_y + (height // 3))
-                elif direction == "down":
-                    if start_y < buffer_pixels:  # Too close to top
-                        start_y = buffer_pixels
-                    end_y = max(0, start_y - (height // 3))
-                elif direction == "left":
-                    end_x = min(width, start_x + (width // 3))
-                elif direction == "right":
-                    end_x = max(0, start_x - (width // 3))
-                else:
+                swipe = self.swipe_for(direction, start_x, start_y, window_size['width'], window_size['height'])
+                if swipe is None:
                     print(f"[DeviceController] Unknown scroll direction: {direction}")
                     return
-                self.device.scroll(start_x, start_y, end_x, end_y)
-                self.logger.log_action(f"SCROLL {direction} from {start_from}")
+                start_x, start_y, end_x, end_y = swipe
+                self._timed("action", self.device.scroll, start_x, start_y, end_x, end_y, settle)
+                self.recorder.log_text(f"SCROLL {direction} from {start_from}")
                 self.step_manager.add_step(json.dumps(action_data))
                 action_data["coordinates"] = [start_x, start_y, end_x, end_y]
-                self.action_data_logger.log_action(json.dumps(action_data))
+                action_data["grounding_backend"] = getattr(self.showui, "last_backend", None)
+                self._record(action_data, screenshot)
                 return True
             print(f"[ActionHandler] ShowUI failed to find coordinates for '{start_from}'.")
         else:
             print(f"[ActionHandler] Missing 'start_from' for scroll action.")
         return False
     
-    def handle_system(self, action_data, screenshot_path):
+    def handle_scroll_search(self, action_data, screenshot, settle: bool = True):
+        """
+        Swipes in action_data["direction"] until the element named in desc is on screen,
+        without asking the model in between. After each swipe the new frame is checked
+        against the view hierarchy (HierarchyGrounder.locate). ShowUI always answers with
+        a point and cannot say an element is absent, so without a hierarchy the step fails.
+        The search stops at the first hit, when two consecutive frames are the same (end of
+        the list) or after max_search_swipes. The swipe count is recorded either way.
+        :return: True if the element was found.
+        """
+        if not hasattr(self.showui, "locate"):
+            print("[ActionHandler] scroll_search needs a grounder that can search the view hierarchy.")
+            return False
+        target = action_data.get("desc", "")
+        direction = action_data.get("direction", "down").lower()
+        window_size = self.device.driver.get_window_size()
+        width, height = window_size['width'], window_size['height']
+        swipe = self.swipe_for(direction, width // 2, height // 2, width, height)
+        if not target or swipe is None:
+            print(f"[ActionHandler] scroll_search needs a desc and a direction (got '{direction}').")
+            return False
+
+        found, swipes, end_reason = self._timed("action", self._scroll_until_visible, target, swipe, screenshot)
+        if found is not None:
+            print(f"[ActionHandler] Found '{target}' after {swipes} swipe(s).")
+            self.recorder.log_text(f"SCROLL_SEARCH {direction} found {target} after {swipes} swipes")
+            action_data["coordinates"] = list(found)
+        else:
+            print(f"[ActionHandler] '{target}' not found after {swipes} swipe(s) ({end_reason}).")
+            self.recorder.log_text(f"SCROLL_SEARCH {direction} for {target}: not found after {swipes} swipes ({end_reason})")
+        action_data["swipes"] = swipes
+        action_data["found"] = found is not None
+        self.step_manager.add_step(json.dumps(action_data))
+        action_data["grounding_backend"] = "hierarchy"
+        self._record(action_data, screenshot)
+        return found is not None
+
+    def _scroll_until_visible(self, target: str, swipe: tuple, screenshot) -> tuple:
+        """
+        :return: (coordinates of the target or None, swipes made, why the search stopped).
+        """
+        screenshot = as_screenshot(screenshot)
+        store = getattr(self.recorder, "screenshot_store", None)
+        swipes = 0
+        with tracer.span("handler.scroll_search", target=target) as span:
+            coords = self._locate(screenshot, target)
+            reason = "found"
+            while coords is None:
+                if swipes >= self.max_search_swipes:
+                    reason = "swipe limit"
+                    break
+                self.device.scroll(*swipe)
+                swipes += 1
+                previous = screenshot
+                screenshot = self.device.capture(store=store)
+                if hamming_distance(previous.fingerprint(), screenshot.fingerprint()) <= self.END_OF_LIST_DISTANCE:
+                    reason = "end of list"
+                    break
+                coords = self._locate(screenshot, target)
+            span.set(swipes=swipes, found=coords is not None)
+        return coords, swipes, reason
+
+    def _locate(self, screenshot, target: str):
+        return self.showui.locate(screenshot, target)
+
+    @staticmethod
+    def swipe_for(direction: str, start_x: int, start_y: int, width: int, height: int):
+        """
+        Swipe coordinates that scroll the content in the given direction from (start_x, start_y),
+        keeping the start away from the screen edges.
+        :return: (start_x, start_y, end_x, end_y), or None for an unknown direction.
+        """
+        end_x, end_y = start_x, start_y
+
+        BUFFER_RATIO = 0.3  # 30% buffer from top/bottom
+        buffer_pixels = int(height * BUFFER_RATIO)
+
+        if direction == "up":
+            if start_y > (height - buffer_pixels):  # Too close to bottom
+                start_y = height - buffer_pixels
+            end_y = min(height, start_y + (height // 3))
+        elif direction == "down":
+            if start_y < buffer_pixels:  # Too close to top
+                start_y = buffer_pixels
+            end_y = max(0, start_y - (height // 3))
+        elif direction == "left":
+            end_x = min(width, start_x + (width // 3))
+        elif direction == "right":
+            end_x = max(0, start_x - (width // 3))
+        else:
+            return None
+        return start_x, start_y, end_x, end_y
+
+    def handle_system(self, action_data, screenshot, settle: bool = True):
         """
         Handles system actions such as back, home, recent apps, volume control, and power.
         """
@@ -109,25 +239,47 @@ class ActionHandler:
         if system_action in system_action_map:
             if system_action == "hide_keyboard":
                 try:
-                    self.device.driver.hide_keyboard()
-                    self.logger.log_action("SYSTEM Hide Keyboard")
+                    self._timed("action", self.device.hide_keyboard)
+                    self.recorder.log_text("SYSTEM Hide Keyboard")
                     self.step_manager.add_step("Hid the keyboard")
+                    self._record(action_data, screenshot)
                     return True
                 except Exception as e:
                     print(f"[ActionHandler] Failed to hide keyboard: {e}")
                     return False
             else:
-                try:
-                    self.device.driver.press_keycode(system_action_map[system_action])
-                    self.logger.log_action(f"SYSTEM {system_action.replace('_', ' ').title()}")
+                # Volume keys only show an overlay, there is no new screen to wait for.
+                settle = settle and system_action not in ("volume_up", "volume_down")
+                if self._timed("action", self.device.press_keys, [system_action_map[system_action]], settle):
+                    self.recorder.log_text(f"SYSTEM {system_action.replace('_', ' ').title()}")
                     self.step_manager.add_step(f"Performed system action: {system_action}")
+                    self._record(action_data, screenshot)
                     return True
-                except Exception as e:
-                    print(f"[ActionHandler] Failed to execute system action '{system_action}': {e}")
-                    return False
+                print(f"[ActionHandler] Failed to execute system action '{system_action}'.")
+                return False
 
         print(f"[ActionHandler] Unknown system action: {system_action}")
         return False
 
-        
+    def _timed(self, phase, fn, *args):
+        """
+        Calls fn and adds its duration (ms) under timings[phase] of the next record.
+        """
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"handler.{phase}", fn=getattr(fn, "__name__", str(fn))):
+                return fn(*args)
+        finally:
+            self.recorder.annotate(timings={phase: round((time.perf_counter() - start) * 1000, 1)})
 
+    def _record(self, action_data, screenshot):
+        """
+        Writes the executed action to the session record, tagged with the
+        fingerprint of the screen it was grounded on so replays can detect drift.
+        """
+        screenshot = as_screenshot(screenshot)
+        try:
+            action_data["screen"] = screenshot.fingerprint()
+        except Exception as e:
+            print(f"[ActionHandler] Could not fingerprint screenshot: {e}")
+        self.recorder.record(action_data, screenshot=screenshot)
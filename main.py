@@ -1,37 +1,192 @@
 import os
-from utils.step_manager import StepManager
-from controllers.test_controller import TestController
-from clients.openai_client import OpenAIClient
-from clients.showui_client import ShowUiClient
-from controllers.device_controller import DeviceController
-from utils.action_logger import ActionLogger
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from utils.tracing import tracer
 
-def main():
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# appium, openai and gradio_client take about a second to import, so clients are imported
+# where they are built, and single runs build them while the goal is being typed.
 
-    openai_client = OpenAIClient(
-        api_key=OPENAI_API_KEY,
-        model_name="gpt-4o" 
+def desired_caps_for(device_name: str) -> dict:
+    return {
+        "platformName": "Android",
+        "deviceName": device_name,
+        "udid": device_name,
+        "automationName": "UiAutomator2",
+        "noReset": True,
+        "newCommandTimeout": 600
+    }
+
+def run_parallel(goals_file: str, devices: list, openai_api_key: str, approval_factory,
+                 use_decision_cache: bool = True, plan_mode: bool = False, stream: bool = True,
+                 use_screen_graph: bool = True):
+    from controllers.parallel_runner import ParallelTestRunner
+    from clients.openai_client import OpenAIClient
+    from clients.showui_client import ShowUiClient
+    from clients.hierarchy_grounder import HierarchyGrounder
+    from clients.rate_limited_client import RateLimitedClient
+    from clients.cached_model_client import CachedModelClient
+    from utils.grounding_cache import GroundingCache
+    from utils.decision_cache import DecisionCache
+    from utils.screen_graph import ScreenGraph
+    from controllers.system_prompt import system_prompt, plan_system_prompt
+
+    with open(goals_file, 'r') as f:
+        goals = [line.strip() for line in f if line.strip()]
+
+    endpoints = []
+    for device in devices or ["emulator-5554=http://127.0.0.1:4723"]:
+        name, _, server = device.partition("=")
+        endpoints.append({
+            "name": name,
+            "appium_server": server or "http://127.0.0.1:4723",
+            "desired_caps": desired_caps_for(name)
+        })
+
+    model_client = RateLimitedClient(OpenAIClient(api_key=openai_api_key, model_name="gpt-4o"))
+    if use_decision_cache:
+        # Outside the rate limiter, so cached answers are returned without waiting for a slot.
+        model_client = CachedModelClient(model_client, DecisionCache(prompts=[system_prompt, plan_system_prompt]))
+    grounding_cache = GroundingCache()
+    runner = ParallelTestRunner(
+        endpoints=endpoints,
+        model_client=model_client,
+        showui_factory=lambda device: HierarchyGrounder(device.driver, ShowUiClient(cache=grounding_cache)),
+        approval_factory=approval_factory,
+        plan_mode=plan_mode,
+        stream=stream,
+        screen_graph=ScreenGraph() if use_screen_graph else None
     )
-    showui_client = ShowUiClient()
-    device_ctrl = DeviceController(
+    report = runner.run(goals)
+    for result in report["results"]:
+        print(f"[{result['status']}] {result['goal']} on {result['device']}: "
+              f"{result['executed']} steps in {result['seconds']}s")
+    print(f"[ParallelTestRunner] {report['summary']}")
+    if use_decision_cache:
+        print(f"[Decision cache] {model_client.cache.stats()}")
+
+def open_device(session_id: str = None, reuse_session: bool = False):
+    from controllers.device_controller import DeviceController
+    return DeviceController(
         appium_server="http://127.0.0.1:4723",
-        desired_caps={
-            "platformName": "Android",
-            "deviceName": "emulator-5554",
-            "automationName": "UiAutomator2",
-            "noReset": True,
-            "newCommandTimeout": 600
-        }
+        desired_caps=desired_caps_for("emulator-5554"),
+        session_id=session_id,
+        reuse_session=reuse_session
     )
-    step_manager = StepManager()
 
-    test_controller = TestController(
-        openai_client=openai_client,
-        showui=showui_client,
-        device=device_ctrl,
-        step_manager=step_manager
+def connect_showui(warm_up: bool = True):
+    """
+    :param warm_up: Open the connection to the Space now. Without it the client connects
+                    on the first query, which a replay may never make.
+    """
+    from clients.showui_client import ShowUiClient
+    from utils.grounding_cache import GroundingCache
+    showui_client = ShowUiClient(cache=GroundingCache())
+    if warm_up:
+        showui_client.warm_up()
+    return showui_client
+
+def build_model_client(api_key: str, use_decision_cache: bool = True):
+    from clients.openai_client import OpenAIClient
+    from clients.cached_model_client import CachedModelClient
+    from utils.decision_cache import DecisionCache
+    from controllers.system_prompt import system_prompt, plan_system_prompt
+    openai_client = OpenAIClient(
+        api_key=api_key,
+        model_name="gpt-4o"
     )
+    if use_decision_cache:
+        openai_client = CachedModelClient(openai_client, DecisionCache(prompts=[system_prompt, plan_system_prompt]))
+    return openai_client
+
+def report_failure(name: str):
+    """
+    Done-callback that reports a failed warm-up right away instead of after the goal is typed.
+    """
+    def callback(future):
+        if future.exception() is not None:
+            print(f"\n[main] Could not start {name}: {future.exception()}")
+    return callback
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Mobile Testing Agent")
+    parser.add_argument("--replay", metavar="ACTION_FILE",
+                        help="Replay a recorded *_action.json session instead of running a new test.")
+    parser.add_argument("--goals", metavar="GOALS_FILE",
+                        help="Run every goal in the file (one per line) unattended across the devices.")
+    parser.add_argument("--device", action="append", metavar="NAME=APPIUM_URL",
+                        help="Device for --goals, e.g. emulator-5556=http://127.0.0.1:4725. Repeatable.")
+    parser.add_argument("--approval", choices=["console", "auto", "rules", "gate"],
+                        help="How steps are approved: ask on the console (default), approve everything, "
+                             "deny risky system actions, or only ask when a suggestion looks wrong. "
+                             "--goals runs default to auto.")
+    parser.add_argument("--max-steps", type=int, help="Step budget per goal.")
+    parser.add_argument("--max-seconds", type=float, help="Time budget per goal.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Ask the model for several actions per call and only re-plan when the screen "
+                             "does not match the plan.")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Wait for complete model answers instead of streaming them.")
+    parser.add_argument("--no-screen-graph", action="store_true",
+                        help="Do not follow paths learned from earlier sessions; every step comes from the model.")
+    parser.add_argument("--no-decision-cache", action="store_true",
+                        help="Always ask the model instead of reusing answers from earlier runs on the same screen.")
+    parser.add_argument("--reuse-session", action="store_true",
+                        help="Attach to the Appium session the previous run left open (it stays open for the "
+                             "server's newCommandTimeout) instead of creating a new one.")
+    parser.add_argument("--session-id", metavar="SESSION_ID",
+                        help="Attach to this running Appium session instead of creating a new one.")
+    parser.add_argument("--trace", metavar="TRACE_FILE",
+                        help="Record timing spans for every phase and write them as Chrome trace JSON.")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.enabled = True
+    try:
+        run(args)
+    finally:
+        if args.trace:
+            print(tracer.summary_table())
+            tracer.export_chrome(args.trace)
+
+def run(args):
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    from controllers.approval_policy import build_policy
+
+    if args.goals:
+        run_parallel(
+            args.goals, args.device, OPENAI_API_KEY,
+            approval_factory=lambda: build_policy(args.approval or "auto", args.max_steps, args.max_seconds),
+            use_decision_cache=not args.no_decision_cache,
+            plan_mode=args.plan,
+            stream=not args.no_stream,
+            use_screen_graph=not args.no_screen_graph
+        )
+        return
+
+    # The Appium session, the ShowUI Space and the model client are set up in the background;
+    # a single run asks for its goal in the meantime.
+    warm_up = ThreadPoolExecutor(max_workers=3, thread_name_prefix="warm-up")
+    device_future = warm_up.submit(open_device, args.session_id, args.reuse_session)
+    device_future.add_done_callback(report_failure("the Appium session"))
+    # Replayed steps whose screen still matches never ground, so a replay connects only when one has to.
+    showui_future = warm_up.submit(connect_showui, not args.replay)
+    showui_future.add_done_callback(report_failure("ShowUI"))
+    model_future = None
+    if not args.replay:
+        model_future = warm_up.submit(build_model_client, OPENAI_API_KEY, not args.no_decision_cache)
+        model_future.add_done_callback(report_failure("the model client"))
+    warm_up.shutdown(wait=False)
+
+    # Project modules are imported on this thread only once the warm-up is done with its imports.
+    if args.replay:
+        showui_client = showui_future.result()
+        device_ctrl = device_future.result()
+        from clients.hierarchy_grounder import HierarchyGrounder
+        from controllers.replay_controller import ReplayController
+        grounder = HierarchyGrounder(device_ctrl.driver, showui_client)
+        ReplayController(device=device_ctrl, showui=grounder).replay(args.replay)
+        print(f"[Grounding cache] {showui_client.cache.stats()}")
+        return
 
     # Get the user's test goal
     test_goal = input("Enter your test goal: ").strip()
@@ -39,8 +194,36 @@ def main():
         print("No test goal provided. Exiting.")
         return
 
+    with tracer.span("startup.wait"):
+        showui_client = showui_future.result()
+        device_ctrl = device_future.result()
+        openai_client = model_future.result()
+
+    from clients.hierarchy_grounder import HierarchyGrounder
+    from controllers.test_controller import TestController
+    from utils.step_manager import StepManager
+    from utils.screen_graph import ScreenGraph
+
+    # Elements with obvious text/content-desc/resource-id are resolved from the view hierarchy.
+    grounder = HierarchyGrounder(device_ctrl.driver, showui_client)
+    step_manager = StepManager()
+
+    test_controller = TestController(
+        openai_client=openai_client,
+        showui=grounder,
+        device=device_ctrl,
+        step_manager=step_manager,
+        approver=build_policy(args.approval or "console", args.max_steps, args.max_seconds),
+        plan_mode=args.plan,
+        stream=not args.no_stream,
+        screen_graph=None if args.no_screen_graph else ScreenGraph()
+    )
+
     # Start the interactive session
     test_controller.run_test(test_goal)
+    print(f"[Grounding] {grounder.stats}, cache {showui_client.cache.stats()}")
+    if not args.no_decision_cache:
+        print(f"[Decision cache] {openai_client.cache.stats()}")
     print("\nDone. All actions are logged in test_script.txt.")
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from utils.fingerprint import hamming_distance
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercases and collapses whitespace, so formatting-only differences in the
+    goal or step history do not split cache entries.
+    """
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class DecisionCache:
+    """
+    Caches model suggestions for a (goal, screen, step history) on disk.
+
+    Each entry is keyed by a context hash (model, system prompt hash, goal,
+    normalized step history and feedback) plus the screen fingerprint. A lookup
+    accepts the closest stored fingerprint within max_distance bits, so a
+    changed clock or a blinking cursor still hits. Entries written under a
+    system prompt that is no longer in use are purged on startup.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ".cache/decisions.sqlite",
+        max_entries: int = 20000,
+        max_age_seconds: float = 14 * 24 * 3600,
+        max_distance: int = 6,
+        prompts: list = None
+    ):
+        """
+        :param db_path: Location of the SQLite store (":memory:" for a throwaway cache).
+        :param max_entries: Maximum number of rows kept; least recently used rows go first.
+        :param max_age_seconds: Entries older than this are treated as misses and purged.
+        :param max_distance: Max hamming distance between screen fingerprints still counted as the same screen.
+        :param prompts: The system prompts currently in use. Entries stored under any other prompt are deleted.
+        """
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            "context TEXT, fingerprint TEXT, prompt TEXT, response TEXT, created REAL, last_used REAL, "
+            "PRIMARY KEY (context, fingerprint))"
+        )
+        self._db.commit()
+        if prompts:
+            self._purge_other_prompts([prompt_hash(prompt) for prompt in prompts])
+        self.evict()
+
+    @staticmethod
+    def make_context(model_name: str, system_prompt: str, goal: str, previous_steps: str, user_feedback: str) -> str:
+        """
+        Hashes everything except the screen that determines the model's answer.
+        """
+        parts = [model_name or "", prompt_hash(system_prompt), normalize_text(goal),
+                 normalize_text(previous_steps), normalize_text(user_feedback)]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, context: str, fingerprint: str):
+        """
+        Looks up the cached response for the context on a matching screen.
+        :return: (stored fingerprint, response) of the closest match, or None on a miss.
+                 The stored fingerprint is the key to discard() the entry by.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT fingerprint, response, created FROM decisions WHERE context = ?", (context,)
+            ).fetchall()
+            best = None
+            for stored_fingerprint, response, created in rows:
+                if now - created > self.max_age_seconds:
+                    continue
+                distance = hamming_distance(stored_fingerprint, fingerprint)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, stored_fingerprint, response)
+
+            if best is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE decisions SET last_used = ? WHERE context = ? AND fingerprint = ?",
+                (now, context, best[1])
+            )
+            self._db.commit()
+            self.hits += 1
+            return best[1], best[2]
+
+    def put(self, context: str, fingerprint: str, system_prompt: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO decisions (context, fingerprint, prompt, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (context, fingerprint, prompt_hash(system_prompt), response, now, now)
+            )
+            self._db.commit()
+
+    def discard(self, context: str, fingerprint: str):
+        """
+        Removes one entry, e.g. a cached suggestion that was rejected.
+        """
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM decisions WHERE context = ? AND fingerprint = ?", (context, fingerprint)
+            )
+            self._db.commit()
+
+    def evict(self):
+        """
+        Drops expired rows and trims the store down to max_entries, least recently used first.
+        """
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM decisions WHERE created < ?", (time.time() - self.max_age_seconds,)
+            )
+            self._db.execute(
+                "DELETE FROM decisions WHERE rowid NOT IN "
+                "(SELECT rowid FROM decisions ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+    def _purge_other_prompts(self, current: list):
+        # Answers produced under an older system prompt are stale: drop them.
+        with self._lock:
+            placeholders = ", ".join("?" for _ in current)
+            self._db.execute(f"DELETE FROM decisions WHERE prompt NOT IN ({placeholders})", current)
+            self._db.commit()
@@ -0,0 +1,40 @@
+from PIL import Image
+
+HASH_SIZE = 16
+
+
+def screen_fingerprint(image, hash_size: int = HASH_SIZE) -> str:
+    """
+    Computes a perceptual difference hash (dHash) of a screenshot.
+
+    The screenshot is downscaled to a tiny grayscale thumbnail, so small
+    rendering noise (clock digits, blinking cursor) usually maps to the same
+    fingerprint while real screen changes do not.
+
+    :param image: A path to an image file or an already opened PIL image.
+    :param hash_size: Edge length of the hash grid; the result has hash_size**2 bits.
+    :return: The fingerprint as a hex string.
+    """
+    if isinstance(image, Image.Image):
+        return _dhash(image, hash_size)
+    with Image.open(image) as img:
+        return _dhash(img, hash_size)
+
+
+def hamming_distance(fingerprint_a: str, fingerprint_b: str) -> int:
+    """
+    Returns the number of differing bits between two fingerprints.
+    """
+    return bin(int(fingerprint_a, 16) ^ int(fingerprint_b, 16)).count("1")
+
+
+def _dhash(img: Image.Image, hash_size: int) -> str:
+    thumb = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumb.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
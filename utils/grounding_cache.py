@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercases a grounding query and collapses whitespace and trailing punctuation,
+    so "Click on  Search bar." and "click on search bar" share a cache entry.
+    """
+    return re.sub(r"\s+", " ", query.strip().lower()).strip(" .!?")
+
+
+class GroundingCache:
+    """
+    Caches ShowUI grounding results keyed by screen fingerprint and query.
+
+    Lookups hit an in-memory LRU first and fall back to a SQLite file, so
+    results survive between sessions. Entries are evicted by age and by count,
+    on open and again every evict_every inserts.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ".cache/grounding.sqlite",
+        max_memory_entries: int = 512,
+        max_disk_entries: int = 20000,
+        max_age_seconds: float = 7 * 24 * 3600,
+        evict_every: int = 500,
+    ):
+        """
+        :param db_path: Location of the on-disk store. Use None for a memory-only cache.
+        :param max_memory_entries: Size of the in-memory LRU.
+        :param max_disk_entries: Maximum number of rows kept on disk.
+        :param max_age_seconds: Entries older than this are treated as misses and purged.
+        :param evict_every: Run evict() after this many inserts, so long sessions stay within max_disk_entries.
+        """
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age_seconds = max_age_seconds
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS grounding ("
+                "key TEXT PRIMARY KEY, x INTEGER, y INTEGER, created REAL, last_used REAL)"
+            )
+            self._db.commit()
+            self.evict()
+
+    @staticmethod
+    def make_key(fingerprint: str, size: tuple, query: str) -> str:
+        return f"{fingerprint}:{size[0]}x{size[1]}:{normalize_query(query)}"
+
+    def get(self, key: str):
+        """
+        Returns the cached (x, y) for the key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                coords, created = entry
+                if now - created <= self.max_age_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return coords
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT x, y, created FROM grounding WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[2] <= self.max_age_seconds:
+                    coords = (row[0], row[1])
+                    self._db.execute("UPDATE grounding SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, coords, row[2])
+                    self.hits += 1
+                    return coords
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, coords: tuple):
+        """
+        Stores a successful grounding result. Failed lookups are never cached.
+        """
+        if coords is None or None in coords:
+            return
+        now = time.time()
+        coords = (int(coords[0]), int(coords[1]))
+        with self._lock:
+            self._remember(key, coords, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO grounding (key, x, y, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, coords[0], coords[1], now, now)
+                )
+                self._db.commit()
+            self._puts += 1
+            due = self.evict_every and self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired rows and trims the disk store down to max_disk_entries,
+        least recently used first.
+        """
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM grounding WHERE created < ?", (time.time() - self.max_age_seconds,)
+            )
+            self._db.execute(
+                "DELETE FROM grounding WHERE key NOT IN "
+                "(SELECT key FROM grounding ORDER BY last_used DESC LIMIT ?)",
+                (self.max_disk_entries,)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key: str, coords: tuple, created: float):
+        self._memory[key] = (coords, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
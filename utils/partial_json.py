@@ -0,0 +1,92 @@
+import json
+
+
+class PartialJsonParser:
+    """
+    Incrementally parses a flat JSON object (string, number, bool or null values)
+    from streamed text, such as {"action": "click", "desc": "search bar"}.
+
+    feed() returns the fields that are complete so far, so a caller can act on
+    "action" and "desc" while the rest of the object is still arriving. Text
+    before the opening brace (e.g. a stray code fence) is ignored. Nested
+    objects and arrays are not supported: parsing stops and `failed` is set,
+    and callers fall back to the final text.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self.failed = False
+        self._state = "start"
+        self._token = None
+        self._escape = False
+        self._key = None
+
+    def feed(self, text: str) -> dict:
+        """
+        Consumes the next chunk of text.
+        :return: All fields completed so far.
+        """
+        for char in text:
+            if self.done or self.failed:
+                break
+            self._step(char)
+        return self.fields
+
+    def _step(self, char: str):
+        if self._token is not None and self._token.startswith('"'):
+            self._token += char
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._finish_token()
+            return
+
+        if self._token is not None:
+            # Inside a number / true / false / null literal.
+            if char in ",}" or char.isspace():
+                self._finish_token()
+                self._step(char)
+            else:
+                self._token += char
+            return
+
+        if self._state == "start":
+            if char == "{":
+                self._state = "key"
+        elif self._state == "key":
+            if char == '"':
+                self._token = char
+            elif char == "}":
+                self.done = True
+            elif not (char.isspace() or char == ","):
+                self.failed = True
+        elif self._state == "colon":
+            if char == ":":
+                self._state = "value"
+            elif not char.isspace():
+                self.failed = True
+        elif self._state == "value":
+            if char == '"' or char in "-0123456789tfn":
+                self._token = char
+            elif char in "{[":
+                self.failed = True
+            elif not char.isspace():
+                self.failed = True
+
+    def _finish_token(self):
+        try:
+            value = json.loads(self._token)
+        except json.JSONDecodeError:
+            self.failed = True
+            return
+        finally:
+            self._token = None
+        if self._state == "key":
+            self._key = value
+            self._state = "colon"
+        else:
+            self.fields[self._key] = value
+            self._state = "key"
@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from utils.decision_cache import normalize_text
+from utils.fingerprint import hamming_distance
+
+# Actions that can be repeated without asking the model: clicks and scrolls at their
+# recorded coordinates, typing and system keys as they are.
+REPLAYABLE_ACTIONS = ("click", "scroll", "type", "system")
+
+
+class ScreenGraph:
+    """
+    A map of the app built from recorded sessions.
+
+    Nodes are screen fingerprints (near-identical fingerprints are merged into
+    one node) and edges are the actions that led from one screen to the next,
+    with their recorded coordinates and how often they worked. For each goal
+    the screen the model finished on is remembered, so a later run of the same
+    goal can walk the shortest known path there before asking the model.
+
+    The graph lives in SQLite and is held in memory after startup; sessions are
+    merged in incrementally.
+    """
+
+    def __init__(self, db_path: str = ".cache/screen_graph.sqlite", max_distance: int = 6):
+        """
+        :param db_path: Location of the SQLite store (":memory:" for a throwaway graph).
+        :param max_distance: Max hamming distance between fingerprints of the same screen.
+        """
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS edges ("
+            "source TEXT, target TEXT, action TEXT, desc TEXT, start_from TEXT, coordinates TEXT, "
+            "successes INTEGER, failures INTEGER, last_seen REAL, "
+            "PRIMARY KEY (source, target, action, desc, start_from))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS goals (goal TEXT, screen TEXT, count INTEGER, PRIMARY KEY (goal, screen))"
+        )
+        self._db.commit()
+
+        # source fingerprint -> {edge key: edge dict}
+        self.edges = {}
+        self.nodes = set()
+        self.goals = {}
+        for row in self._db.execute(
+            "SELECT source, target, action, desc, start_from, coordinates, successes, failures FROM edges"
+        ):
+            self._remember_edge({
+                "source": row[0], "target": row[1], "action": row[2], "desc": row[3], "start_from": row[4],
+                "coordinates": json.loads(row[5]) if row[5] else None, "successes": row[6], "failures": row[7]
+            })
+        for goal, screen, count in self._db.execute("SELECT goal, screen, count FROM goals"):
+            self.goals.setdefault(goal, {})[screen] = count
+
+    def node_for(self, fingerprint: str):
+        """
+        Returns the known node closest to the fingerprint, or None if the screen is new.
+        """
+        if not fingerprint:
+            return None
+        if fingerprint in self.nodes:
+            return fingerprint
+        best = None
+        for node in list(self.nodes):
+            distance = hamming_distance(node, fingerprint)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, node)
+        return best[1] if best else None
+
+    def matches(self, fingerprint: str, node: str) -> bool:
+        return bool(fingerprint) and hamming_distance(fingerprint, node) <= self.max_distance
+
+    def add_session(self, records: list, goal: str = None, final_screen: str = None):
+        """
+        Merges one session into the graph: each record's screen links to the next
+        record's screen, and the last one to final_screen if the session finished.
+        :param records: Records from a session's *_action.json, in order.
+        :param goal: The session's test goal; remembered together with final_screen.
+        :param final_screen: Fingerprint of the screen the goal was completed on.
+        """
+        records = [r for r in records if r.get("screen")]
+        targets = [r["screen"] for r in records[1:]] + [final_screen]
+        with self._lock:
+            now = time.time()
+            for record, target in zip(records, targets):
+                action = str(record.get("action", "")).lower()
+                if not target or action not in REPLAYABLE_ACTIONS:
+                    continue
+                if action in ("click", "scroll") and not record.get("coordinates"):
+                    continue
+                edge = self._remember_edge({
+                    "source": self._canonical(record["screen"]),
+                    "target": self._canonical(target),
+                    "action": action,
+                    "desc": record.get("desc", ""),
+                    "start_from": record.get("start_from", ""),
+                    "coordinates": record.get("coordinates"),
+                    "successes": 0,
+                    "failures": 0
+                })
+                edge["successes"] += 1
+                edge["coordinates"] = record.get("coordinates") or edge["coordinates"]
+                self._save_edge(edge, now)
+
+            if goal and final_screen:
+                key = normalize_text(goal)
+                screen = self._canonical(final_screen)
+                screens = self.goals.setdefault(key, {})
+                screens[screen] = screens.get(screen, 0) + 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO goals (goal, screen, count) VALUES (?, ?, ?)",
+                    (key, screen, screens[screen])
+                )
+            self._db.commit()
+
+    def add_session_file(self, path: str, goal: str = None, final_screen: str = None):
+        """
+        Merges a session's *_action.json file (see add_session).
+        """
+        records = []
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        self.add_session(records, goal=goal, final_screen=final_screen)
+
+    def record_failure(self, edge: dict):
+        """
+        Counts a traversal that did not reach the edge's target screen.
+        Edges that fail more often than they work are no longer used for paths.
+        """
+        with self._lock:
+            edge["failures"] += 1
+            self._save_edge(edge, time.time())
+            self._db.commit()
+
+    def goal_target(self, goal: str):
+        """
+        The screen the goal was most often completed on, or None for a new goal.
+        """
+        screens = self.goals.get(normalize_text(goal))
+        if not screens:
+            return None
+        return max(screens.items(), key=lambda item: item[1])[0]
+
+    def shortest_path(self, fingerprint: str, target: str) -> list:
+        """
+        Breadth-first search for the fewest known actions from the current screen to target.
+        Among equally short paths, edges that worked more often are preferred.
+        :return: The edges to follow, or [] if the screen is unknown or no path exists.
+        """
+        source = self.node_for(fingerprint)
+        if source is None or target is None or source == target:
+            return []
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            edges = sorted(self.edges.get(node, {}).values(), key=lambda e: e["successes"], reverse=True)
+            for edge in edges:
+                if edge["failures"] > edge["successes"] or edge["target"] in previous:
+                    continue
+                previous[edge["target"]] = edge
+                if edge["target"] == target:
+                    path = []
+                    while edge is not None:
+                        path.append(edge)
+                        edge = previous[edge["source"]]
+                    return list(reversed(path))
+                queue.append(edge["target"])
+        return []
+
+    @staticmethod
+    def action_data(edge: dict) -> dict:
+        """
+        The edge as an action dict for ActionHandler.
+        """
+        action_data = {"action": edge["action"], "desc": edge["desc"]}
+        if edge["start_from"]:
+            action_data["start_from"] = edge["start_from"]
+        if edge["coordinates"]:
+            action_data["coordinates"] = list(edge["coordinates"])
+        return action_data
+
+    def stats(self) -> dict:
+        return {
+            "nodes": len(self.nodes),
+            "edges": sum(len(edges) for edges in self.edges.values()),
+            "goals": len(self.goals),
+        }
+
+    def _canonical(self, fingerprint: str) -> str:
+        return self.node_for(fingerprint) or fingerprint
+
+    def _remember_edge(self, edge: dict) -> dict:
+        key = (edge["target"], edge["action"], edge["desc"], edge["start_from"] or "")
+        edges = self.edges.setdefault(edge["source"], {})
+        if key not in edges:
+            edges[key] = edge
+            self.nodes.add(edge["source"])
+            self.nodes.add(edge["target"])
+        return edges[key]
+
+    def _save_edge(self, edge: dict, now: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO edges (source, target, action, desc, start_from, coordinates, "
+            "successes, failures, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (edge["source"], edge["target"], edge["action"], edge["desc"], edge["start_from"] or "",
+             json.dumps(edge["coordinates"]) if edge["coordinates"] else None,
+             edge["successes"], edge["failures"], now)
+        )
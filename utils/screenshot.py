@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from utils.fingerprint import screen_fingerprint
+
+# Screenshots are written to disk in the background so a step never waits on log I/O.
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot-writer")
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class Screenshot:
+    """
+    A single captured frame, held in memory and decoded at most once.
+
+    The same object feeds the vision model (a size-bounded JPEG/WebP re-encode),
+    the grounding client (native resolution) and the session log (written to
+    disk asynchronously). A frame attached to a ScreenshotStore is only written
+    when something needs it on disk.
+    """
+
+    def __init__(self, png_bytes: bytes, path: str = None, store=None):
+        """
+        :param png_bytes: The raw PNG returned by the device.
+        :param path: Where the frame lives (or will live) on disk, if anywhere.
+        :param store: ScreenshotStore that saves the frame the first time its path is needed.
+        """
+        self.png_bytes = png_bytes
+        self.store = store
+        self._path = path
+        self._content_hash = None
+        self._save_future = None
+        self._image = None
+        self._fingerprint = None
+        self._model_images = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_path(cls, path: str) -> "Screenshot":
+        with open(path, 'rb') as f:
+            return cls(f.read(), path=path)
+
+    @property
+    def image(self) -> Image.Image:
+        """
+        The decoded frame. Decoding happens once, on first access.
+        """
+        with self._lock:
+            if self._image is None:
+                img = Image.open(io.BytesIO(self.png_bytes))
+                img.load()
+                self._image = img
+            return self._image
+
+    @property
+    def size(self) -> tuple:
+        return self.image.size
+
+    def content_hash(self) -> str:
+        """
+        SHA-256 of the raw capture, used as the frame's identity in a ScreenshotStore.
+        """
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.png_bytes).hexdigest()
+        return self._content_hash
+
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = screen_fingerprint(self.image)
+        return self._fingerprint
+
+    def model_image(self, max_short_side: int = 768, max_long_side: int = 2048,
+                    image_format: str = "JPEG", quality: int = 85) -> bytes:
+        """
+        Returns a downscaled, re-encoded copy for the vision model.
+
+        GPT-4o style models rescale images so the short side is at most 768px,
+        so sending more pixels than that only costs upload bytes.
+        """
+        key = (max_short_side, max_long_side, image_format, quality)
+        if key not in self._model_images:
+            img = self.image.convert("RGB")
+            width, height = img.size
+            scale = min(1.0, max_short_side / min(width, height), max_long_side / max(width, height))
+            if scale < 1.0:
+                img = img.resize((round(width * scale), round(height * scale)), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format=image_format, quality=quality)
+            self._model_images[key] = buffer.getvalue()
+        return self._model_images[key]
+
+    def data_url(self, image_format: str = "JPEG", **kwargs) -> str:
+        """
+        Returns the model variant as a data URL with the matching MIME type.
+        """
+        encoded = base64.b64encode(self.model_image(image_format=image_format, **kwargs)).decode('utf-8')
+        return f"data:{MIME_TYPES[image_format]};base64,{encoded}"
+
+    def save_async(self, path: str, image_format: str = "PNG", quality: int = 85):
+        """
+        Schedules the frame to be written to path without blocking the caller.
+        :param image_format: "PNG" writes the capture as-is; "WEBP" or "JPEG" re-encode it at full resolution.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path = path
+        self._save_future = _writer.submit(self._write, path, image_format, quality)
+        return self._save_future
+
+    def mark_saved(self, path: str):
+        """
+        Points the frame at an existing file with the same content instead of writing it again.
+        """
+        self._path = path
+
+    @property
+    def file_path(self) -> str:
+        """
+        Where the frame is (being) written, without waiting for the write; None if unsaved.
+        """
+        return self._path
+
+    @property
+    def path(self) -> str:
+        """
+        The on-disk location of the frame, waiting for a pending write to finish.
+        """
+        if self._path is None and self.store is not None:
+            self.store.put(self)
+        if self._save_future is not None:
+            self._save_future.result()
+        if self._path is None:
+            raise ValueError("Screenshot has not been saved to disk.")
+        return self._path
+
+    def _write(self, path: str, image_format: str = "PNG", quality: int = 85):
+        if image_format == "PNG":
+            with open(path, 'wb') as f:
+                f.write(self.png_bytes)
+        else:
+            self.image.convert("RGB").save(path, format=image_format, quality=quality)
+
+
+def as_screenshot(screenshot) -> Screenshot:
+    """
+    Accepts either a Screenshot or a path to an image file.
+    """
+    if isinstance(screenshot, Screenshot):
+        return screenshot
+    return Screenshot.from_path(screenshot)
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from utils.fingerprint import hamming_distance
+from utils.screenshot import Screenshot
+
+EXTENSIONS = {"PNG": "png", "WEBP": "webp", "JPEG": "jpg"}
+
+
+class FrameRef:
+    """
+    One step's frame in a session manifest. The image is only read from disk by load().
+    """
+
+    def __init__(self, session: str, step: int, frame: str, path: str, ts: float):
+        self.session = session
+        self.step = step
+        self.frame = frame
+        self.path = path
+        self.ts = ts
+
+    def load(self) -> Screenshot:
+        """
+        Reads the frame, or returns None if retention already removed it.
+        """
+        if not os.path.exists(self.path):
+            return None
+        return Screenshot.from_path(self.path)
+
+    def __repr__(self):
+        return f"FrameRef(session={self.session!r}, step={self.step}, frame={self.frame[:12]})"
+
+
+class ScreenshotStore:
+    """
+    Content-addressed storage for captured frames.
+
+    Frames are written once under objects/<hash[:2]>/<hash>.<ext>. A frame
+    identical to one already stored is not written again, and a frame recorded
+    for a session step is also not written when it is a near duplicate (by
+    screen fingerprint) of a recently stored one. Frames can be recompressed to
+    WebP or JPEG. A manifest in index.sqlite links every session step to its
+    frame, and retention evicts frames by age and total size, plus frames no
+    step refers to (e.g. from rejected suggestions).
+    """
+
+    def __init__(
+        self,
+        root: str = "screenshots",
+        image_format: str = "PNG",
+        quality: int = 80,
+        near_duplicate_distance: int = 2,
+        max_bytes: int = 2 * 1024 ** 3,
+        max_age_seconds: float = None,
+        orphan_age_seconds: float = 3600,
+        retention_interval: int = 200
+    ):
+        """
+        :param root: Directory holding the objects and the index.
+        :param image_format: "PNG" keeps the capture as-is; "WEBP" or "JPEG" recompress it.
+        :param quality: Encoder quality for WEBP/JPEG.
+        :param near_duplicate_distance: Max fingerprint distance for a recorded frame to reuse a recent one (-1 disables).
+        :param max_bytes: Total size of stored frames before the least recently used are evicted (0 disables).
+        :param max_age_seconds: Frames not used for this long are evicted (None keeps them).
+        :param orphan_age_seconds: Frames no step refers to are evicted after this long.
+        :param retention_interval: Retention runs automatically after this many new frames.
+        """
+        self.root = root
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.near_duplicate_distance = near_duplicate_distance
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.orphan_age_seconds = orphan_age_seconds
+        self.retention_interval = retention_interval
+        self.stats = {"written": 0, "duplicates": 0, "near_duplicates": 0, "evicted": 0}
+        self._recent = deque(maxlen=32)
+        self._new_since_retention = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS frames ("
+            "frame TEXT PRIMARY KEY, path TEXT, fingerprint TEXT, bytes INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "session TEXT, step INTEGER, frame TEXT, ts REAL, PRIMARY KEY (session, step))"
+        )
+        self._db.commit()
+
+    def put(self, screenshot: Screenshot, session: str = None, step: int = None) -> str:
+        """
+        Stores the frame (if it is not stored yet) and points the screenshot at its file.
+        :param session: With step, links the frame to that step in the session manifest.
+        :return: The frame id (content hash) to refer to it by.
+        """
+        frame = screenshot.content_hash()
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT path FROM frames WHERE frame = ?", (frame,)).fetchone()
+            if row is not None:
+                self.stats["duplicates"] += 1
+            elif session is not None and self.near_duplicate_distance >= 0:
+                row = self._near_duplicate(screenshot)
+                if row is not None:
+                    frame = row[1]
+                    row = (row[0],)
+                    self.stats["near_duplicates"] += 1
+
+            if row is not None:
+                path = row[0]
+                self._db.execute("UPDATE frames SET last_used = ? WHERE frame = ?", (now, frame))
+                if screenshot.file_path is None:
+                    screenshot.mark_saved(path)
+            else:
+                path = os.path.join(self.root, "objects", frame[:2], f"{frame}.{EXTENSIONS[self.image_format]}")
+                screenshot.save_async(path, image_format=self.image_format, quality=self.quality)
+                size = len(screenshot.png_bytes) if self.image_format == "PNG" else None
+                fingerprint = screenshot.fingerprint()
+                self._db.execute(
+                    "INSERT INTO frames (frame, path, fingerprint, bytes, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (frame, path, fingerprint, size, now, now)
+                )
+                self.stats["written"] += 1
+                self._new_since_retention += 1
+                self._recent.append((fingerprint, frame, path))
+
+            if session is not None and step is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO manifest (session, step, frame, ts) VALUES (?, ?, ?, ?)",
+                    (session, step, frame, now)
+                )
+            self._db.commit()
+            run_retention = self.retention_interval and self._new_since_retention >= self.retention_interval
+
+        if run_retention:
+            self.enforce_retention()
+        return frame
+
+    def path_for(self, frame: str) -> str:
+        with self._lock:
+            row = self._db.execute("SELECT path FROM frames WHERE frame = ?", (frame,)).fetchone()
+        return row[0] if row else None
+
+    def open(self, frame: str) -> Screenshot:
+        """
+        Loads a stored frame by id, or returns None if it is not (or no longer) stored.
+        """
+        path = self.path_for(frame)
+        if path is None or not os.path.exists(path):
+            return None
+        return Screenshot.from_path(path)
+
+    def sessions(self) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT session FROM manifest ORDER BY session").fetchall()
+        return [row[0] for row in rows]
+
+    def session_frames(self, session: str) -> list:
+        """
+        The session's steps in order, as FrameRefs that read their image only on load().
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT m.step, m.frame, f.path, m.ts FROM manifest m JOIN frames f ON f.frame = m.frame "
+                "WHERE m.session = ? ORDER BY m.step", (session,)
+            ).fetchall()
+        return [FrameRef(session, step, frame, path, ts) for step, frame, path, ts in rows]
+
+    def enforce_retention(self) -> int:
+        """
+        Evicts frames past max_age_seconds, unreferenced frames past orphan_age_seconds,
+        then the least recently used frames until the store fits in max_bytes.
+        :return: The number of frames evicted.
+        """
+        now = time.time()
+        with self._lock:
+            self._new_since_retention = 0
+            evict = []
+            if self.max_age_seconds is not None:
+                evict += self._db.execute(
+                    "SELECT frame, path FROM frames WHERE last_used < ?", (now - self.max_age_seconds,)
+                ).fetchall()
+            evict += self._db.execute(
+                "SELECT frame, path FROM frames WHERE created < ? AND frame NOT IN (SELECT frame FROM manifest)",
+                (now - self.orphan_age_seconds,)
+            ).fetchall()
+
+            if self.max_bytes:
+                evicted = {frame for frame, _ in evict}
+                rows = self._db.execute(
+                    "SELECT frame, path, bytes FROM frames ORDER BY last_used DESC"
+                ).fetchall()
+                total = 0
+                for frame, path, size in rows:
+                    if frame in evicted:
+                        continue
+                    if size is None:
+                        size = self._measure(frame, path)
+                    total += size
+                    if total > self.max_bytes:
+                        evict.append((frame, path))
+
+            evict = dict(evict)
+            for frame, path in evict.items():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[ScreenshotStore] Could not remove {path}: {e}")
+                    continue
+                self._db.execute("DELETE FROM frames WHERE frame = ?", (frame,))
+                self._db.execute("DELETE FROM manifest WHERE frame = ?", (frame,))
+                self.stats["evicted"] += 1
+            self._db.commit()
+            self._recent = deque(
+                (entry for entry in self._recent if entry[1] not in evict), maxlen=self._recent.maxlen
+            )
+            return len(evict)
+
+    def _near_duplicate(self, screenshot: Screenshot):
+        fingerprint = screenshot.fingerprint()
+        for stored_fingerprint, frame, path in self._recent:
+            if hamming_distance(stored_fingerprint, fingerprint) <= self.near_duplicate_distance:
+                return (path, frame)
+        return None
+
+    def _measure(self, frame: str, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 0
+        self._db.execute("UPDATE frames SET bytes = ? WHERE frame = ?", (size, frame))
+        return size
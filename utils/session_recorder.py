@@ -0,0 +1,179 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+FSYNC_NEVER = "never"
+FSYNC_ON_FLUSH = "flush"
+FSYNC_ALWAYS = "always"
+
+_CLOSE = object()
+
+
+class SessionRecorder:
+    """
+    Records one test session as structured JSONL plus a human-readable text view.
+
+    `<base>_action.json` gets one JSON record per executed action (step number,
+    action, coordinates, screen fingerprint, grounding backend, screenshot
+    reference and timings) and stays readable by ReplayController. `<base>.txt`
+    keeps the short "CLICK search bar" lines.
+
+    Writes go through a queue to a background thread that keeps both files open,
+    flushes on a timer and optionally fsyncs, so the agent loop never blocks on
+    storage and a crash loses at most one flush interval.
+    """
+
+    def __init__(
+        self,
+        base_path: str,
+        flush_interval: float = 1.0,
+        fsync: str = FSYNC_ON_FLUSH,
+        max_bytes: int = 0,
+        backup_count: int = 5,
+        screenshot_store=None
+    ):
+        """
+        :param base_path: Path prefix for the session files, e.g. "runs/test-search-bar".
+        :param flush_interval: Max seconds a record may sit in the buffer before it is flushed.
+        :param fsync: "never", "flush" (fsync after every flush) or "always" (flush+fsync every record).
+        :param max_bytes: Rotate the JSONL file once it grows past this size (0 disables rotation).
+        :param backup_count: Number of rotated files kept (<file>.1 is the most recent). Must be at
+                             least 1 when max_bytes is set, otherwise rotating would drop the records.
+        :param screenshot_store: ScreenshotStore that keeps each recorded step's frame and
+                                 links it to the step in its session manifest.
+        """
+        if max_bytes > 0 and backup_count < 1:
+            raise ValueError("Rotating the action log (max_bytes > 0) needs backup_count >= 1")
+        self.jsonl_path = f"{base_path}_action.json"
+        self.text_path = f"{base_path}.txt"
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.screenshot_store = screenshot_store
+        self.session = os.path.basename(base_path)
+        self.step = 0
+        self._pending = {}
+        self._queue = queue.Queue()
+
+        directory = os.path.dirname(base_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Files rotated out by an earlier session under the same name would be replayed with this one.
+        index = 1
+        while os.path.exists(f"{self.jsonl_path}.{index}"):
+            os.remove(f"{self.jsonl_path}.{index}")
+            index += 1
+        self._jsonl = open(self.jsonl_path, 'w', buffering=64 * 1024)
+        self._text = open(self.text_path, 'w', buffering=16 * 1024)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_text(self, line: str):
+        """
+        Appends a line to the human-readable view.
+        """
+        self._queue.put(("text", line))
+
+    def begin_step(self, **fields):
+        """
+        Starts a new step: drops fields left over from a step that produced no record.
+        """
+        self._pending = {}
+        self.annotate(**fields)
+
+    def annotate(self, **fields):
+        """
+        Attaches fields (e.g. timings) to the next record. Dict values are merged.
+        """
+        for key, value in fields.items():
+            if isinstance(value, dict) and isinstance(self._pending.get(key), dict):
+                self._pending[key].update(value)
+            else:
+                self._pending[key] = value
+
+    def record(self, action_data: dict, screenshot=None, **fields):
+        """
+        Queues one structured record for an executed action.
+        :param action_data: The action as executed, including coordinates if grounded.
+        :param screenshot: The Screenshot the action was grounded on, referenced by path
+                           (and by frame id when a screenshot store is used).
+        """
+        self.step += 1
+        record = dict(action_data)
+        record.update(self._pending)
+        record.update(fields)
+        record["step"] = self.step
+        record["ts"] = round(time.time(), 3)
+        self._pending = {}
+        if screenshot is not None and self.screenshot_store is not None:
+            record["frame"] = self.screenshot_store.put(screenshot, session=self.session, step=self.step)
+            record["screenshot"] = self.screenshot_store.path_for(record["frame"])
+        elif screenshot is not None and getattr(screenshot, "file_path", None):
+            record["screenshot"] = screenshot.file_path
+        self._queue.put(("json", json.dumps(record)))
+
+    def close(self):
+        """
+        Flushes everything still queued and closes the files.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_CLOSE, None))
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        dirty = False
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = None, None
+
+            if kind == "json":
+                self._jsonl.write(payload + "\n")
+                dirty = True
+                if self.max_bytes and self._jsonl.tell() >= self.max_bytes:
+                    self._rotate()
+            elif kind == "text":
+                self._text.write(payload + "\n")
+                dirty = True
+
+            closing = kind is _CLOSE
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if dirty and (closing or due or self.fsync == FSYNC_ALWAYS):
+                self._flush()
+                dirty = False
+                last_flush = time.monotonic()
+            elif due:
+                last_flush = time.monotonic()
+
+            if closing:
+                self._jsonl.close()
+                self._text.close()
+                return
+
+    def _flush(self):
+        for f in (self._jsonl, self._text):
+            f.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(f.fileno())
+
+    def _rotate(self):
+        self._flush()
+        self._jsonl.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.jsonl_path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.jsonl_path}.{index + 1}")
+        os.replace(self.jsonl_path, f"{self.jsonl_path}.1")
+        self._jsonl = open(self.jsonl_path, 'w', buffering=64 * 1024)
@@ -0,0 +1,109 @@
+import io
+import time
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+from utils.tracing import tracer
+
+class SettleDetector:
+    """
+    Decides when the screen has stopped changing after an action.
+
+    Frames are compared as small grayscale thumbnails with a tolerance on the
+    mean pixel difference instead of exact hash equality, so a blinking cursor
+    or a sub-pixel animation does not keep the screen "moving" forever.
+    Regions can be ignored (e.g. status bar, carousel banners) or, conversely,
+    the comparison can be restricted to a few regions of interest.
+    """
+
+    def __init__(
+        self,
+        thumb_width: int = 96,
+        tolerance: float = 1.5,
+        min_interval: float = 0.15,
+        max_interval: float = 0.6,
+        backoff: float = 1.6,
+        ignore_regions: list = None,
+        regions: list = None
+    ):
+        """
+        :param thumb_width: Width frames are downscaled to before comparing (aspect ratio is kept).
+        :param tolerance: Max mean absolute difference (0-255) between two frames still counted as stable.
+        :param min_interval: First polling interval in seconds.
+        :param max_interval: Upper bound for the polling interval while the screen keeps changing.
+        :param backoff: Factor the interval grows by after every frame that still changed.
+        :param ignore_regions: (left, top, right, bottom) boxes in 0..1 fractions that are masked out.
+        :param regions: (left, top, right, bottom) boxes in 0..1 fractions; if given, only these are compared.
+        """
+        self.thumb_width = thumb_width
+        self.tolerance = tolerance
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # Mask the status bar (clock, notification icons) unless told otherwise.
+        self.ignore_regions = [(0.0, 0.0, 1.0, 0.04)] if ignore_regions is None else ignore_regions
+        self.regions = regions or []
+        self.iterations = 0
+
+    def wait(self, capture, timeout: float = 10):
+        """
+        Polls frames from capture() until two consecutive ones are within tolerance.
+        :param capture: Callable returning the current screen as PNG bytes.
+        :param timeout: Max time (seconds) to wait before giving up.
+        :return: (settled, png_bytes) with the last captured frame.
+        """
+        start_time = time.time()
+        interval = self.min_interval
+        self.iterations = 0
+        prev_thumb = None
+        frame = None
+
+        while True:
+            with tracer.span("settle.frame"):
+                frame = capture()
+                thumb = self._thumbnail(frame)
+            self.iterations += 1
+
+            if prev_thumb is not None:
+                difference = self.difference(prev_thumb, thumb)
+                if difference <= self.tolerance:
+                    return True, frame
+                # Still changing: a transition or animation is running, so back off.
+                interval = min(self.max_interval, interval * self.backoff)
+
+            if time.time() - start_time + interval >= timeout:
+                return False, frame
+            prev_thumb = thumb
+            time.sleep(interval)
+
+    @staticmethod
+    def difference(thumb_a: Image.Image, thumb_b: Image.Image) -> float:
+        """
+        Mean absolute per-pixel difference between two thumbnails of the same size.
+        """
+        if thumb_a.size != thumb_b.size:
+            return 255.0
+        return ImageStat.Stat(ImageChops.difference(thumb_a, thumb_b)).mean[0]
+
+    def _thumbnail(self, png_bytes: bytes) -> Image.Image:
+        with Image.open(io.BytesIO(png_bytes)) as img:
+            height = max(1, round(img.height * self.thumb_width / img.width))
+            thumb = img.convert("L").resize((self.thumb_width, height), Image.BILINEAR)
+
+        width, height = thumb.size
+        if self.ignore_regions:
+            draw = ImageDraw.Draw(thumb)
+            for box in self.ignore_regions:
+                draw.rectangle(self._scale(box, width, height), fill=0)
+        if self.regions:
+            strips = [thumb.crop(self._scale(box, width, height)) for box in self.regions]
+            combined = Image.new("L", (sum(s.width for s in strips), max(s.height for s in strips)))
+            offset = 0
+            for strip in strips:
+                combined.paste(strip, (offset, 0))
+                offset += strip.width
+            thumb = combined
+        return thumb
+
+    @staticmethod
+    def _scale(box, width, height):
+        left, top, right, bottom = box
+        return (int(left * width), int(top * height), int(right * width), int(bottom * height))
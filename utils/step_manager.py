@@ -1,20 +1,147 @@
+import json
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with tiktoken when it is installed, otherwise estimates ~4 characters per token.
+    """
+    global _encoding, tiktoken
+    if not text:
+        return 0
+    if tiktoken is not None and _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # Encoding files could not be loaded (e.g. offline); fall back to the estimate.
+            tiktoken = None
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
 class StepManager:
     def __init__(self):
         self.steps = []
-        self.user_feedback = []  
+        self.user_feedback = []
 
     def add_step(self, step: str):
         self.steps.append(step)
 
-    def get_steps_as_text(self) -> str:
-        return "\n".join(self.steps)
-    
     def get_steps_as_text(self) -> str:
         return "\n".join(self.steps)
 
-    def add_user_feedback(self, action: str, approved: bool):
+    def add_user_feedback(self, action: str, approved: bool, reason: str = ""):
+        """
+        :param reason: Why an approval policy decided this way, kept with the feedback for the model.
+        """
         feedback = f"{'Accepted' if approved else 'Rejected'}: {action}"
+        if reason:
+            feedback += f" ({reason})"
         self.user_feedback.append(feedback)
 
     def get_user_feedback(self) -> str:
-        return "\n".join(self.user_feedback)
\ No newline at end of file
+        return "\n".join(self.user_feedback)
+
+
+class StepContextManager:
+    """
+    Builds the step history and user feedback sent to the model within a token budget.
+
+    The most recent steps are sent verbatim; older ones are folded into compact
+    one-line summaries of fixed-size chunks. A chunk's summary never changes once
+    written, so the start of the prompt stays byte-identical between calls and
+    provider-side prompt caching keeps hitting. Repeated feedback is deduplicated.
+    """
+
+    def __init__(self, token_budget: int = 1200, window: int = 6, summary_chunk: int = 5,
+                 feedback_share: float = 0.35):
+        """
+        :param token_budget: Max tokens for steps and feedback combined.
+        :param window: Number of most recent steps kept verbatim.
+        :param summary_chunk: Number of older steps folded into one summary line.
+        :param feedback_share: Fraction of the budget reserved for user feedback.
+        """
+        self.token_budget = token_budget
+        self.window = window
+        self.summary_chunk = summary_chunk
+        self.feedback_share = feedback_share
+
+    def build(self, step_manager: StepManager) -> tuple:
+        """
+        :return: (previous_steps, user_feedback) strings ready for OpenAIClient.get_next_step.
+        """
+        feedback_budget = int(self.token_budget * self.feedback_share)
+        feedback_lines = self._fit_newest(self.dedupe_feedback(step_manager.user_feedback), feedback_budget)
+        feedback = "\n".join(feedback_lines)
+        steps = self.build_steps(step_manager.steps, self.token_budget - count_tokens(feedback))
+        return steps, feedback
+
+    def build_steps(self, steps: list, budget: int) -> str:
+        # Only summarize whole chunks so existing summary lines stay stable as the session grows.
+        split = max(0, len(steps) - self.window)
+        split -= split % self.summary_chunk
+        summaries = [
+            self._summarize(steps[i:i + self.summary_chunk], i)
+            for i in range(0, split, self.summary_chunk)
+        ]
+        recent = steps[split:]
+
+        fitted = self._fit_newest(recent, budget)
+        remaining = budget - count_tokens("\n".join(fitted))
+        # Summaries are only kept if no recent step was cut, so the history has no gap.
+        kept = self._fit_newest(summaries, remaining) if len(fitted) == len(recent) else []
+        omitted = len(steps) - len(fitted) - len(kept) * self.summary_chunk
+        lines = ([f"({omitted} earlier steps omitted)"] if omitted else []) + kept + fitted
+        return "\n".join(lines)
+
+    @staticmethod
+    def dedupe_feedback(feedback: list) -> list:
+        """
+        Keeps only the last occurrence of each feedback line, in chronological order.
+        """
+        seen = set()
+        deduped = []
+        for line in reversed(feedback):
+            if line not in seen:
+                seen.add(line)
+                deduped.append(line)
+        return list(reversed(deduped))
+
+    @staticmethod
+    def compact_step(step: str) -> str:
+        try:
+            data = json.loads(step)
+        except (json.JSONDecodeError, TypeError):
+            return step
+        if not isinstance(data, dict):
+            return step
+        text = f"{data.get('action', '')} {data.get('desc', '')}".strip()
+        if data.get("start_from"):
+            text += f" from {data['start_from']}"
+        return text
+
+    def _summarize(self, chunk: list, offset: int) -> str:
+        actions = "; ".join(self.compact_step(step) for step in chunk)
+        return f"Steps {offset + 1}-{offset + len(chunk)}: {actions}"
+
+    @staticmethod
+    def _fit_newest(lines: list, budget: int) -> list:
+        """
+        Returns the longest suffix of lines whose combined token count fits the budget.
+        """
+        kept = []
+        used = 0
+        for line in reversed(lines):
+            tokens = count_tokens(line) + 1
+            if used + tokens > budget:
+                break
+            kept.append(line)
+            used += tokens
+        return list(reversed(kept))
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Numeric span args that are added up per span name in the summary.
+SUMMED_ARGS = ("prompt_tokens", "completion_tokens", "image_bytes", "iterations", "chars")
+
+
+class Span:
+    """
+    One timed phase. Extra details (token usage, backend, settle iterations)
+    go into args and show up in the trace viewer and the summary.
+    """
+
+    __slots__ = ("name", "start", "end", "thread_id", "thread_name", "session", "args")
+
+    def __init__(self, name: str, session: str, args: dict):
+        self.name = name
+        self.session = session
+        self.args = args
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        return False
+
+
+class _NullSpan:
+    """
+    Returned while tracing is disabled, so instrumented code costs one call.
+    """
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects timing spans across the agent loop.
+
+    Spans are tagged with the thread they ran on and the session (test goal)
+    active on that thread, so one trace can hold several devices running in
+    parallel. Export as Chrome trace-event JSON (chrome://tracing, Perfetto)
+    or print a per-session summary table.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def span(self, name: str, **args):
+        """
+        Times the enclosed block:  with tracer.span("llm", model=...) as span: ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        span = Span(name, getattr(self._local, "session", None), args)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @property
+    def current_session(self) -> str:
+        return getattr(self._local, "session", None)
+
+    @contextmanager
+    def session(self, name: str):
+        """
+        Tags spans started on this thread with the given session name.
+        """
+        previous = getattr(self._local, "session", None)
+        self._local.session = name
+        try:
+            yield
+        finally:
+            self._local.session = previous
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+        self._origin = time.perf_counter()
+
+    def finished_spans(self, session: str = None) -> list:
+        with self._lock:
+            spans = list(self.spans)
+        return [s for s in spans if s.end is not None and (session is None or s.session == session)]
+
+    def chrome_trace(self) -> dict:
+        """
+        Returns the spans as Chrome trace-event JSON ("X" complete events, microseconds).
+        """
+        events = []
+        thread_names = {}
+        for span in self.finished_spans():
+            thread_names[span.thread_id] = span.thread_name
+            args = dict(span.args)
+            if span.session:
+                args["session"] = span.session
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": round((span.start - self._origin) * 1e6, 1),
+                "dur": round((span.end - span.start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": args
+            })
+        for thread_id, thread_name in thread_names.items():
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": os.getpid(),
+                "tid": thread_id, "args": {"name": thread_name}
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        print(f"[Tracer] Wrote {len(self.finished_spans())} spans to {path}")
+
+    def summary(self, session: str = None) -> dict:
+        """
+        Per span name: count, total/mean/p50/p95/max in ms, plus the sums of SUMMED_ARGS
+        (token usage, uploaded bytes, settle iterations).
+        """
+        durations = defaultdict(list)
+        totals = defaultdict(lambda: defaultdict(float))
+        for span in self.finished_spans(session):
+            durations[span.name].append(span.duration_ms)
+            for key in SUMMED_ARGS:
+                if key in span.args:
+                    totals[span.name][key] += span.args[key]
+
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[name] = {
+                "count": len(values),
+                "total_ms": round(sum(values), 1),
+                "mean_ms": round(sum(values) / len(values), 1),
+                "p50_ms": round(values[int(0.5 * (len(values) - 1))], 1),
+                "p95_ms": round(values[int(0.95 * (len(values) - 1))], 1),
+                "max_ms": round(values[-1], 1),
+                "totals": {key: round(value, 1) for key, value in totals[name].items()}
+            }
+        return summary
+
+    def summary_table(self, session: str = None) -> str:
+        """
+        The summary as a fixed-width table, slowest phases first.
+        """
+        rows = sorted(self.summary(session).items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        lines = [f"{'span':<24}{'count':>7}{'total ms':>11}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}  totals"]
+        for name, stats in rows:
+            totals = ", ".join(f"{key}={value:g}" for key, value in stats["totals"].items())
+            lines.append(
+                f"{name:<24}{stats['count']:>7}{stats['total_ms']:>11.1f}{stats['mean_ms']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['max_ms']:>9.1f}  {totals}"
+            )
+        return "\n".join(lines)
+
+
+# Process-wide tracer, disabled until enabled (e.g. by main.py --trace).
+tracer = Tracer()
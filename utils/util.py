@@ -6,14 +6,50 @@ schema = {
     "properties": {
         "action": {"type": "string"},
         "desc": {"type": "string"},
-        "start_from": {"type": "string"}
+        "start_from": {"type": "string"},
+        "direction": {"type": "string"}
     },
     "required": ["action", "desc"]
 }
 
-def validate_openai_json(next_step_str):
+plan_schema = {
+    "type": "object",
+    "properties": {
+        "actions": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string"},
+                    "desc": {"type": "string"},
+                    "start_from": {"type": "string"},
+                    "direction": {"type": "string"},
+                    "expect": {"type": "string"}
+                },
+                "required": ["action", "desc"]
+            }
+        }
+    },
+    "required": ["actions"]
+}
+
+def validate_openai_json(next_step_str, verbose: bool = True) -> bool:
     try:
         step_data = json.loads(next_step_str)
         jsonschema.validate(instance=step_data, schema=schema)
+        return True
+    except (json.JSONDecodeError, jsonschema.ValidationError) as e:
+        if verbose:
+            print(f"[Validation Error] {e}")
+        return False
+
+def validate_plan_json(plan_str, verbose: bool = True) -> bool:
+    try:
+        plan_data = json.loads(plan_str)
+        jsonschema.validate(instance=plan_data, schema=plan_schema)
+        return True
     except (json.JSONDecodeError, jsonschema.ValidationError) as e:
-        print(f"[Validation Error] {e}")
+        if verbose:
+            print(f"[Validation Error] {e}")
+        return False